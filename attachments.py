@@ -0,0 +1,225 @@
+# Proposal attachments, stored in GridFS (bucket "attachments").
+#
+# Uploads are multipart/form-data with one file part. The body is parsed as it
+# arrives and every piece of the file goes straight into a GridFS upload
+# stream, so memory use is bounded by the request chunk size, not the file
+# size, and nothing is spooled to disk. Downloads stream the file back chunk by
+# chunk and answer single "Range: bytes=..." requests with 206.
+# Submissions keep only the metadata (id, name, type, size) in "attachments".
+import os
+from datetime import datetime
+from typing import Optional
+from urllib.parse import quote
+from bson import ObjectId
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from gridfs.errors import NoFile
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+import database
+
+ATTACHMENT_BUCKET = "attachments"
+MAX_ATTACHMENT_BYTES = int(os.getenv("MAX_ATTACHMENT_BYTES", str(20 * 1024 * 1024)))
+MAX_ATTACHMENTS = 10
+# Multipart overhead (boundaries, part headers) allowed on top of the file
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+def get_bucket():
+    return AsyncIOMotorGridFSBucket(database.get_database(), bucket_name=ATTACHMENT_BUCKET)
+
+def attachment_filename(raw: bytes):
+    # Browsers may send a full path; keep the last component
+    name = raw.decode("utf-8", "replace").replace("\\", "/").rsplit("/", 1)[-1].strip()
+    return name[:255] or "attachment"
+
+# Collects the parser callbacks between two writes: headers are handled right
+# away, file data is queued for the async GridFS writes
+class _FilePartReader:
+    def __init__(self, boundary: bytes):
+        self.filename = None
+        self.content_type = None
+        self.pending = []
+        self.done = False
+        self._in_file = False
+        self._headers = {}
+        self._field = b""
+        self._value = b""
+        self.parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field, self._value = b"", b""
+
+    def _on_headers_finished(self):
+        # The first part with a filename is the file, other parts are ignored
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if self.filename is None and not self.done and b"filename" in options:
+            self.filename = attachment_filename(options[b"filename"])
+            content_type = self._headers.get(b"content-type", b"").decode("latin-1").strip()
+            self.content_type = content_type or DEFAULT_CONTENT_TYPE
+            self._in_file = True
+
+    def _on_part_data(self, data, start, end):
+        if self._in_file:
+            self.pending.append(data[start:end])
+
+    def _on_part_end(self):
+        if self._in_file:
+            self._in_file = False
+            self.done = True
+
+# Streams the uploaded file into GridFS and returns its metadata
+async def receive_attachment(request: Request, metadata: dict, max_bytes: int = MAX_ATTACHMENT_BYTES):
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Attachments are limited to {max_bytes} bytes")
+
+    reader = _FilePartReader(options[b"boundary"])
+    upload = None
+    size = 0
+    try:
+        async for chunk in request.stream():
+            reader.parser.write(chunk)
+            if reader.pending:
+                if upload is None:
+                    upload = get_bucket().open_upload_stream(
+                        reader.filename, metadata={**metadata, "content_type": reader.content_type}
+                    )
+                size += sum(len(data) for data in reader.pending)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Attachments are limited to {max_bytes} bytes")
+                await upload.writelines(reader.pending)
+                reader.pending = []
+        reader.parser.finalize()
+        if reader.filename is None:
+            raise HTTPException(status_code=400, detail="No file in the upload")
+        if not reader.done:
+            # The body ended inside the file part
+            raise HTTPException(status_code=400, detail="Incomplete multipart upload")
+        if upload is None:
+            # Empty file
+            upload = get_bucket().open_upload_stream(
+                reader.filename, metadata={**metadata, "content_type": reader.content_type}
+            )
+        await upload.close()
+    except BaseException as e:
+        # Client went away, too large or malformed: drop the chunks written so far
+        if upload is not None and not upload.closed:
+            await upload.abort()
+        if isinstance(e, MultipartParseError):
+            raise HTTPException(status_code=400, detail="Malformed multipart upload") from e
+        raise
+    return {
+        "_id": upload._id,
+        "filename": reader.filename,
+        "content_type": reader.content_type,
+        "length": size,
+        "uploaded_at": datetime.utcnow(),
+    }
+
+async def delete_attachment_file(file_id: ObjectId):
+    try:
+        await get_bucket().delete(file_id)
+    except NoFile:
+        pass
+
+async def delete_submission_attachments(submission_id: ObjectId):
+    bucket = get_bucket()
+    async for grid_out in bucket.find({"metadata.submission_id": submission_id}):
+        await delete_attachment_file(grid_out._id)
+
+def parse_range(header: Optional[str], length: int):
+    # (start, end) inclusive for a single byte range; None sends the whole file.
+    # Malformed and multi-range headers are ignored, as RFC 9110 allows.
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, sep, end = header[len("bytes="):].strip().partition("-")
+    if not sep or not (start or end) or (start and not start.isdigit()) or (end and not end.isdigit()):
+        return None
+    unsatisfiable = HTTPException(status_code=416, headers={"Content-Range": f"bytes */{length}"})
+    if not start:
+        # Suffix range: the last N bytes
+        if int(end) == 0 or length == 0:
+            raise unsatisfiable
+        return max(length - int(end), 0), length - 1
+    first = int(start)
+    last = int(end) if end else length - 1
+    if end and last < first:
+        return None
+    if first >= length:
+        raise unsatisfiable
+    return first, min(last, length - 1)
+
+# Streams an attachment. Files never change once uploaded, so the id is the
+# ETag: If-None-Match is answered with 304 and If-Range keeps a resumed
+# download from mixing two files.
+async def attachment_response(
+    file_id: ObjectId,
+    range_header: Optional[str] = None,
+    if_range: Optional[str] = None,
+    if_none_match: Optional[str] = None
+):
+    tag = f'"{file_id}"'
+    headers = {
+        "ETag": tag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=3600",
+    }
+    if if_none_match and tag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    try:
+        grid_out = await get_bucket().open_download_stream(file_id)
+    except NoFile:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    length = grid_out.length
+    byte_range = parse_range(range_header, length) if not if_range or if_range == tag else None
+    metadata = grid_out.metadata or {}
+    headers["Content-Disposition"] = f"attachment; filename*=UTF-8''{quote(grid_out.filename)}"
+    headers["X-Content-Type-Options"] = "nosniff"
+    if byte_range is None:
+        start, end, status_code = 0, length - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    async def body():
+        grid_out.seek(start)
+        remaining = end - start + 1
+        try:
+            while remaining > 0:
+                data = await grid_out.read(min(remaining, grid_out.chunk_size))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
+        finally:
+            grid_out.close()
+
+    return StreamingResponse(
+        body(), status_code=status_code, headers=headers,
+        media_type=metadata.get("content_type", DEFAULT_CONTENT_TYPE)
+    )
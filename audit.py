@@ -0,0 +1,121 @@
+# Submission audit log.
+#
+# Every write to a submission appends an event to the submission_events
+# collection: what happened, who did it and which fields changed. The API
+# queues events in process and a background task writes them in batches (one
+# insert_many on MongoDB), so requests never wait on the audit write. Under
+# load the queue drains in batches of up to AUDIT_BATCH_SIZE; when it is full,
+# writers wait for space rather than dropping events. stop() flushes what is
+# queued.
+import asyncio
+import logging
+from datetime import datetime
+from pymongo.errors import PyMongoError
+import storage
+from metrics import audit_events_written_total, audit_events_failed_total
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_RETRY_SECONDS = 2
+AUDIT_SHUTDOWN_TIMEOUT_SECONDS = 10
+
+# Submission fields whose changes are recorded
+AUDITED_FIELDS = [
+    "title", "content", "project_head", "budget", "venue", "organization_name",
+    "event_datetime", "duration_minutes", "event_end", "status"
+]
+
+def diff(before, after, fields):
+    # {field: {"from": old, "to": new}} for the fields whose value changed
+    before, after = before or {}, after or {}
+    return {
+        f: {"from": before.get(f), "to": after.get(f)}
+        for f in fields if before.get(f) != after.get(f)
+    }
+
+def make_audit_event(event_type: str, submission_id, student_id, actor: str, changes=None, version=None):
+    return {
+        "submission_id": submission_id,
+        "student_id": student_id,
+        "type": event_type,
+        "actor": actor,
+        "changes": changes or {},
+        "version": version,
+        "timestamp": datetime.utcnow(),
+    }
+
+class AuditLog:
+    def __init__(self, queue_size: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self._queue = None
+        self._task = None
+
+    async def record(self, *events):
+        if self._task is None:
+            # Not started (scripts): write through
+            if events:
+                await self._write(list(events))
+            return
+        for event in events:
+            await self._queue.put(event)
+
+    async def _write(self, batch):
+        while True:
+            try:
+                errors = await storage.submission_events.add_many(batch)
+            except (PyMongoError, storage.StorageError) as e:
+                if self._task is None or self._task.done():
+                    audit_events_failed_total.inc(amount=len(batch))
+                    logger.error("Dropping %d audit events: %s", len(batch), e)
+                    return
+                logger.warning("Audit log write failed, retrying: %s", e)
+                await asyncio.sleep(AUDIT_RETRY_SECONDS)
+                continue
+            # Duplicate keys after a retried batch were already written
+            failed = [error for error in errors.values() if error["code"] != 11000]
+            audit_events_written_total.inc(amount=len(batch) - len(failed))
+            if failed:
+                audit_events_failed_total.inc(amount=len(failed))
+                logger.error("Could not write %d audit events: %s", len(failed), failed[0]["message"])
+            return
+
+    async def _run(self):
+        while True:
+            event = await self._queue.get()
+            batch = []
+            # Take whatever queued up while the previous insert was in flight
+            while event is not None:
+                batch.append(event)
+                if len(batch) >= self.batch_size or self._queue.empty():
+                    break
+                event = self._queue.get_nowait()
+            if batch:
+                await self._write(batch)
+            if event is None:
+                return
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        async def flush():
+            # The sentinel is queued behind the pending events, so they are written first
+            await self._queue.put(None)
+            await asyncio.shield(self._task)
+        try:
+            await asyncio.wait_for(flush(), AUDIT_SHUTDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.error("Audit log flush timed out, %d events lost", self._queue.qsize())
+            self._task.cancel()
+        self._task = None
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+audit_log = AuditLog()
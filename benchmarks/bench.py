@@ -0,0 +1,293 @@
+# Benchmark harness for the SOPAS API.
+#
+# Seeds a database with users and submissions, then drives a workload against
+# the FastAPI app in-process through httpx's ASGI transport (no network, no
+# uvicorn) and reports throughput and p50/p95/p99 latency per endpoint.
+#
+#   pip install -r benchmarks/requirements.txt
+#   python benchmarks/bench.py --workload mixed --mongomock
+#   python benchmarks/bench.py --workload admin --mongo-uri mongodb://localhost:27017 --save-baseline
+#   python benchmarks/bench.py --workload admin --mongo-uri mongodb://localhost:27017 --compare
+#   python benchmarks/bench.py --workload mixed --storage sqlite
+#
+# With --mongo-uri the harness uses (and drops) the "sopas_benchmark" database.
+# --storage memory/sqlite runs against the other storage engines (the SQLite
+# file is a temporary one).
+# Results are written to benchmarks/results/, baselines to benchmarks/baselines/.
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+WORKLOADS = ["login", "student", "admin", "mixed"]
+PASSWORD = "benchmark"
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+# Latencies per endpoint label
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    async def call(self, client, label, method, url, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.latencies.setdefault(label, []).append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[label] = self.errors.get(label, 0) + 1
+        return response
+
+    def summary(self, elapsed):
+        endpoints = {}
+        for label, values in sorted(self.latencies.items()):
+            endpoints[label] = {
+                "count": len(values),
+                "errors": self.errors.get(label, 0),
+                "rps": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 50) * 1000, 2),
+                "p95_ms": round(percentile(values, 95) * 1000, 2),
+                "p99_ms": round(percentile(values, 99) * 1000, 2),
+            }
+        return endpoints
+
+async def seed(students, admins, submissions, rng):
+    import storage
+    from models import Submission, new_submission_document, get_password_hash
+    for collection in ["users", "submissions", "comments", "submission_events"]:
+        await storage.get_store().collection(collection).delete_many({})
+    # One bcrypt hash shared by every seeded user keeps seeding fast
+    hashed = get_password_hash(PASSWORD)
+    users = [{"username": f"student_{i}", "password": hashed, "role": "student", "version": 1} for i in range(students)]
+    users += [{"username": f"admin_{i}", "password": hashed, "role": "admin", "version": 1} for i in range(admins)]
+    await storage.users.create_many(users)
+    start = datetime.utcnow() - timedelta(days=365)
+    batch = []
+    for i in range(submissions):
+        event = start + timedelta(days=rng.randint(0, 500), hours=rng.randint(8, 20))
+        document = new_submission_document(Submission(
+            title=f"Proposal {i}",
+            content="Lorem ipsum " * rng.randint(10, 200),
+            project_head=f"Head {i % 97}",
+            budget=rng.randint(0, 100000),
+            venue=f"Room {rng.randint(1, 40)}",
+            organization_name=f"Org {rng.randint(1, 60)}",
+            event_date=event.strftime("%Y-%m-%d"),
+            event_time=event.strftime("%H:%M:%S"),
+        ), f"student_{rng.randrange(students)}")
+        document["status"] = rng.choice(["pending", "pending", "approved", "revision"])
+        document["created_at"] = start + timedelta(seconds=i * 30)
+        batch.append(document)
+        if len(batch) == 1000:
+            await storage.submissions.create_many(batch)
+            batch = []
+    if batch:
+        await storage.submissions.create_many(batch)
+
+async def login(client, recorder, username):
+    response = await recorder.call(client, "POST /login", "POST", "/login", json={"username": username, "password": PASSWORD})
+    if response.status_code != 200:
+        raise RuntimeError(f"login as {username} failed with {response.status_code}: {response.text}")
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def submission_body(rng):
+    return {
+        "title": "Benchmark proposal", "content": "Lorem ipsum " * 50, "project_head": "Head",
+        "budget": rng.randint(0, 100000), "venue": f"Room {rng.randint(1, 40)}",
+        "organization_name": f"Org {rng.randint(1, 60)}", "event_date": "2030-01-15", "event_time": "10:00:00",
+    }
+
+# Virtual users: each loops over its scenario until the deadline
+async def login_user(client, recorder, rng, deadline, students):
+    while time.perf_counter() < deadline:
+        await login(client, recorder, f"student_{rng.randrange(students)}")
+
+async def student_user(client, recorder, rng, deadline, students):
+    headers = await login(client, recorder, f"student_{rng.randrange(students)}")
+    own = []
+    while time.perf_counter() < deadline:
+        await recorder.call(client, "GET /submissions", "GET", "/submissions", params={"limit": 20}, headers=headers)
+        await recorder.call(client, "GET /me", "GET", "/me", headers=headers)
+        response = await recorder.call(client, "POST /submissions", "POST", "/submissions", json=submission_body(rng), headers=headers)
+        if response.status_code == 200:
+            own.append(response.json()["id"])
+        if own:
+            await recorder.call(client, "PUT /submissions/{id}", "PUT", f"/submissions/{rng.choice(own)}", json=submission_body(rng), headers=headers)
+
+async def admin_user(client, recorder, rng, deadline, admins):
+    headers = await login(client, recorder, f"admin_{rng.randrange(admins)}")
+    while time.perf_counter() < deadline:
+        response = await recorder.call(
+            client, "GET /submissions?status=pending", "GET", "/submissions",
+            params={"status": "pending", "view": "summary", "limit": 50}, headers=headers
+        )
+        page = response.json() if response.status_code == 200 else []
+        if not page:
+            continue
+        sub_id = rng.choice(page)["_id"]
+        await recorder.call(client, "POST /submissions/{id}/comment", "POST", f"/submissions/{sub_id}/comment", json={"comment": "Looks good"}, headers=headers)
+        await recorder.call(client, "GET /submissions/{id}/comments", "GET", f"/submissions/{sub_id}/comments", headers=headers)
+        await recorder.call(client, "PUT /submissions/{id}/status", "PUT", f"/submissions/{sub_id}/status", json={"status": rng.choice(["approved", "revision"])}, headers=headers)
+
+def plan(workload, concurrency):
+    if workload == "login":
+        return ["login"] * concurrency
+    if workload == "student":
+        return ["student"] * concurrency
+    if workload == "admin":
+        return ["admin"] * concurrency
+    # mixed: 70% students, 20% admins, 10% logins (at least one of each)
+    admins = max(1, concurrency // 5)
+    logins = max(1, concurrency // 10)
+    return ["admin"] * admins + ["login"] * logins + ["student"] * max(1, concurrency - admins - logins)
+
+async def run(args):
+    import httpx
+    import database
+    import storage
+    sqlite_dir = None
+    if args.storage == "sqlite":
+        sqlite_dir = tempfile.TemporaryDirectory()
+        storage._store = storage.create_store("sqlite", os.path.join(sqlite_dir.name, "bench.db"))
+    else:
+        storage._store = storage.create_store(args.storage)
+    if args.storage != "mongo":
+        backend = args.storage
+    elif args.mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        database._client = AsyncMongoMockClient()
+        database._database = database._client["sopas_benchmark"]
+        backend = "mongomock"
+    else:
+        database._client = database.create_client(args.mongo_uri)
+        database._database = database._client["sopas_benchmark"]
+        backend = "mongod"
+    from main import app
+    from ratelimit import limiter
+    # Every virtual user shares one client address; measure the API, not 429s
+    limiter.enabled = False
+
+    rng = random.Random(args.seed)
+    print(f"seeding {args.students} students, {args.admins} admins, {args.submissions} submissions...")
+    await seed(args.students, args.admins, args.submissions, rng)
+
+    recorder = Recorder()
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            deadline = start + args.duration
+            tasks = []
+            for i, kind in enumerate(plan(args.workload, args.concurrency)):
+                vu_rng = random.Random(args.seed + i)
+                if kind == "login":
+                    tasks.append(login_user(client, recorder, vu_rng, deadline, args.students))
+                elif kind == "student":
+                    tasks.append(student_user(client, recorder, vu_rng, deadline, args.students))
+                else:
+                    tasks.append(admin_user(client, recorder, vu_rng, deadline, args.admins))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+        # Before the lifespan shutdown closes the client
+        if backend == "mongod":
+            await database.get_client().drop_database("sopas_benchmark")
+    if sqlite_dir is not None:
+        sqlite_dir.cleanup()
+
+    return {
+        "workload": args.workload,
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "backend": backend,
+        "config": {
+            "students": args.students, "admins": args.admins, "submissions": args.submissions,
+            "concurrency": args.concurrency, "duration": args.duration, "seed": args.seed,
+            "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"]),
+        },
+        "elapsed_s": round(elapsed, 2),
+        "endpoints": recorder.summary(elapsed),
+    }
+
+def print_report(result):
+    print(f"\n{result['workload']} @ {result['commit']} ({result['backend']}, {result['elapsed_s']}s)")
+    print(f"{'endpoint':38} {'count':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for label, stats in result["endpoints"].items():
+        print(f"{label:38} {stats['count']:>7} {stats['errors']:>5} {stats['rps']:>8} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+
+# Compare p95 per endpoint against the stored baseline; returns True on regression
+def compare(result, baseline, tolerance):
+    print(f"\ncompared with baseline @ {baseline['commit']} (tolerance {tolerance:.0%} on p95)")
+    regressed = False
+    for label, stats in result["endpoints"].items():
+        base = baseline["endpoints"].get(label)
+        if not base or not base["p95_ms"]:
+            continue
+        change = stats["p95_ms"] / base["p95_ms"] - 1
+        flag = "REGRESSION" if change > tolerance else ""
+        regressed = regressed or bool(flag)
+        print(f"{label:38} {base['p95_ms']:>8} -> {stats['p95_ms']:>8} ms ({change:+.1%}) {flag}")
+    return regressed
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workload", choices=WORKLOADS, default="mixed")
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--mongomock", action="store_true", help="use mongomock-motor instead of a mongod")
+    backend.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--storage", choices=["mongo", "memory", "sqlite"], default="mongo", help="storage engine")
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--admins", type=int, default=5)
+    parser.add_argument("--submissions", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=15.0, help="seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--bcrypt-rounds", type=int, default=4, help="lower than production so logins do not dominate")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+    # Must be set before models is imported
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    write_json(os.path.join(BENCH_DIR, "results", f"{result['workload']}-{result['commit']}.json"), result)
+    baseline_path = os.path.join(BENCH_DIR, "baselines", f"{result['workload']}-{result['backend']}.json")
+    if args.save_baseline:
+        write_json(baseline_path, result)
+        print(f"\nbaseline saved to {baseline_path}")
+    if args.compare:
+        if not os.path.exists(baseline_path):
+            sys.exit(f"no baseline at {baseline_path}, run with --save-baseline first")
+        with open(baseline_path) as f:
+            if compare(result, json.load(f), args.tolerance):
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
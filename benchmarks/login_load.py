@@ -0,0 +1,98 @@
+# Load test: latency of GET /submissions while a burst of logins is running.
+#
+# Start the backend first with rate limiting off (all requests come from one
+# address and would mostly get 429), then run:
+#   RATE_LIMIT_ENABLED=0 python main.py
+#   python benchmarks/login_load.py --logins 200 --login-concurrency 32
+# The run fails if any request did not succeed, so the latencies are those of
+# real logins and reads.
+#
+# With bcrypt on the event loop the p99 of GET /submissions grows with every
+# concurrent login; with the hash pool it should stay close to the idle p99.
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+def report(name, latencies):
+    print(f"{name}: n={len(latencies)} "
+          f"p50={percentile(latencies, 50) * 1000:.1f}ms "
+          f"p95={percentile(latencies, 95) * 1000:.1f}ms "
+          f"p99={percentile(latencies, 99) * 1000:.1f}ms")
+
+def ensure_user(base_url, username, password, role):
+    requests.post(f"{base_url}/register", json={"username": username, "password": password, "role": role})
+    response = requests.post(f"{base_url}/login", json={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+# Status codes of every request, checked at the end
+statuses = Counter()
+
+def measure_reads(session, base_url, token, stop, latencies):
+    headers = {"Authorization": f"Bearer {token}"}
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = session.get(f"{base_url}/submissions", params={"limit": 20}, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        statuses[("GET /submissions", response.status_code)] += 1
+
+def login(base_url, username, password):
+    response = requests.post(f"{base_url}/login", json={"username": username, "password": password})
+    statuses[("POST /login", response.status_code)] += 1
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://127.0.0.1:8888")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=32)
+    parser.add_argument("--idle-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    token = ensure_user(args.base_url, "loadtest_admin", "loadtest", "admin")
+    ensure_user(args.base_url, "loadtest_student", "loadtest", "student")
+    session = requests.Session()
+
+    # Baseline: reads only
+    stop = threading.Event()
+    idle = []
+    reader = threading.Thread(target=measure_reads, args=(session, args.base_url, token, stop, idle))
+    reader.start()
+    time.sleep(args.idle_seconds)
+    stop.set()
+    reader.join()
+    report("GET /submissions (idle)", idle)
+
+    # Same reads while a login storm is running
+    stop = threading.Event()
+    busy = []
+    reader = threading.Thread(target=measure_reads, args=(session, args.base_url, token, stop, busy))
+    reader.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.login_concurrency) as pool:
+        for _ in range(args.logins):
+            pool.submit(login, args.base_url, "loadtest_student", "loadtest")
+    elapsed = time.perf_counter() - start
+    stop.set()
+    reader.join()
+    report("GET /submissions (during logins)", busy)
+    print(f"logins: {args.logins} in {elapsed:.2f}s ({args.logins / elapsed:.1f}/s)")
+    failed = {key: count for key, count in statuses.items() if key[1] != 200}
+    if failed:
+        for (request, status), count in sorted(failed.items()):
+            print(f"{request}: {count} responses with status {status}")
+        hint = " (start the backend with RATE_LIMIT_ENABLED=0)" if any(status == 429 for _, status in failed) else ""
+        sys.exit(f"some requests failed, the latencies above are not meaningful{hint}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+# Micro-benchmark for the rate limiter.
+#
+# Measures the per-request cost of the in-memory token bucket, on its own and
+# as RateLimitMiddleware around a no-op ASGI app, for a hot key and for many
+# distinct client IPs.
+#
+#   python benchmarks/ratelimit_bench.py --iterations 200000
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ratelimit import InMemoryBackend, RateLimit, RateLimitMiddleware, limiter
+
+# Never runs out, so every call takes the "allowed" path
+UNLIMITED = RateLimit(rate=1e9, burst=10**9)
+
+async def noop_app(scope, receive, send):
+    pass
+
+async def receive():
+    return {"type": "http.request"}
+
+async def send(message):
+    pass
+
+def scope_for(ip):
+    return {"type": "http", "path": "/submissions", "headers": [], "client": (ip, 50000)}
+
+async def time_backend(iterations, keys):
+    backend = InMemoryBackend()
+    start = time.perf_counter()
+    for i in range(iterations):
+        await backend.acquire(keys[i % len(keys)], UNLIMITED)
+    return (time.perf_counter() - start) / iterations
+
+async def time_middleware(iterations, ips, wrapped):
+    limiter.backend = InMemoryBackend()
+    app = RateLimitMiddleware(noop_app, limit=UNLIMITED) if wrapped else noop_app
+    scopes = [scope_for(ip) for ip in ips]
+    start = time.perf_counter()
+    for i in range(iterations):
+        await app(scopes[i % len(scopes)], receive, send)
+    return (time.perf_counter() - start) / iterations
+
+async def run(args):
+    hot = ["default:ip:10.0.0.1"]
+    many = [f"default:ip:10.{i // 65536}.{i // 256 % 256}.{i % 256}" for i in range(args.clients)]
+    ips = [key.split(":")[-1] for key in many]
+    results = [
+        ("backend, one key", await time_backend(args.iterations, hot)),
+        (f"backend, {args.clients} keys", await time_backend(args.iterations, many)),
+        ("no-op app", await time_middleware(args.iterations, ips, wrapped=False)),
+        (f"middleware, {args.clients} IPs", await time_middleware(args.iterations, ips, wrapped=True)),
+    ]
+    for label, seconds in results:
+        print(f"{label:32} {seconds * 1e6:8.2f} us/request")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    parser.add_argument("--clients", type=int, default=10000)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
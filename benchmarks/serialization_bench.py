@@ -0,0 +1,96 @@
+# Micro-benchmark for response serialization.
+#
+# Builds a page of submissions shaped like the documents Motor returns
+# (ObjectId, naive datetimes) and compares the CPU time per submission of:
+#   encoder  - what GET /submissions did before: str(_id) in place, then
+#              jsonable_encoder and JSONResponse (json.dumps)
+#   model    - validating through the SubmissionOut response model
+#   bson     - BSONResponse: orjson straight from the documents
+#
+#   python benchmarks/serialization_bench.py --page-size 500 --view full
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from models import SubmissionOut, SUMMARY_FIELDS
+from responses import BSONResponse
+
+def make_page(size, view, rng):
+    start = datetime.utcnow() - timedelta(days=365)
+    page = []
+    for i in range(size):
+        event = start + timedelta(days=rng.randint(0, 500), hours=rng.randint(8, 20))
+        doc = {
+            "_id": ObjectId(),
+            "student_id": f"student_{rng.randrange(200)}",
+            "title": f"Proposal {i}",
+            "content": "Lorem ipsum " * rng.randint(10, 200),
+            "project_head": f"Head {i % 97}",
+            "budget": rng.randint(0, 100000),
+            "venue": f"Room {rng.randint(1, 40)}",
+            "organization_name": f"Org {rng.randint(1, 60)}",
+            "event_datetime": event,
+            "duration_minutes": 120,
+            "event_end": event + timedelta(minutes=120),
+            "status": rng.choice(["pending", "approved", "revision"]),
+            "comment_count": rng.randint(0, 5),
+            "last_comment_at": start + timedelta(days=rng.randint(0, 365)),
+            "version": rng.randint(1, 4),
+            "created_at": start + timedelta(seconds=i * 30),
+        }
+        if view == "summary":
+            doc = {k: v for k, v in doc.items() if k == "_id" or k in SUMMARY_FIELDS}
+        page.append(doc)
+    return page
+
+def encoder_path(page):
+    for sub in page:
+        sub["_id"] = str(sub["_id"])
+    return JSONResponse(jsonable_encoder(page)).body
+
+def model_path(page):
+    return JSONResponse(jsonable_encoder([SubmissionOut(**sub) for sub in page], by_alias=True)).body
+
+def bson_path(page):
+    return BSONResponse(page).body
+
+def measure(fn, make, rounds):
+    # Fresh copies each round: the encoder path mutates the documents
+    total = 0.0
+    body = b""
+    for _ in range(rounds):
+        page = make()
+        start = time.process_time()
+        body = fn(page)
+        total += time.process_time() - start
+    return total / rounds, len(body)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--view", choices=["full", "summary"], default="full")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    template = make_page(args.page_size, args.view, random.Random(args.seed))
+    make = lambda: [dict(sub) for sub in template]
+    results = [(name, *measure(fn, make, args.rounds)) for name, fn in
+               [("encoder", encoder_path), ("model", model_path), ("bson", bson_path)]]
+    baseline = results[0][1]
+    print(f"{args.page_size} submissions, {args.view} view, {args.rounds} rounds (CPU time)")
+    for name, seconds, size in results:
+        per_item = seconds / args.page_size * 1e6
+        print(f"{name:8} {seconds * 1000:8.2f} ms/page {per_item:8.2f} us/submission "
+              f"{baseline / seconds:6.1f}x {size:>9} bytes")
+
+if __name__ == "__main__":
+    main()
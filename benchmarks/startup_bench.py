@@ -0,0 +1,62 @@
+# Cold start benchmark.
+#
+# Imports the app in fresh interpreters (what every worker does on start) and
+# reports the median wall time, plus the slowest direct imports of the module
+# from python -X importtime.
+#
+#   python benchmarks/startup_bench.py --runs 10
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def import_time(module):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+# Returns the module's cumulative import time and its slowest direct imports
+def slowest_imports(module, count):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, check=True, capture_output=True, text=True
+    )
+    # "import time: self [us] | cumulative | imported package", nesting by two
+    # spaces of indentation. A package is listed after everything it imports,
+    # so the one-level rows since the last top-level row are its direct imports.
+    children = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        level = (len(name) - len(name.lstrip()) - 1) // 2
+        if level == 1:
+            children.append((int(cumulative), name.strip()))
+        elif level == 0:
+            if name.strip() == module:
+                return int(cumulative), sorted(children, reverse=True)[:count]
+            children = []
+    raise RuntimeError(f"{module} not found in the import time output")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    import_time(args.module)  # warm the filesystem and bytecode caches
+    times = [import_time(args.module) for _ in range(args.runs)]
+    print(f"import {args.module}: median {statistics.median(times) * 1000:.0f} ms, "
+          f"min {min(times) * 1000:.0f} ms over {args.runs} runs")
+    total, children = slowest_imports(args.module, args.top)
+    print(f"\nslowest imports of {args.module} (cumulative, {args.module} itself {total / 1000:.1f} ms):")
+    for micros, name in children:
+        print(f"{micros / 1000:8.1f} ms  {name}")
+
+if __name__ == "__main__":
+    main()
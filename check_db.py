@@ -1,13 +1,26 @@
 import asyncio
-from motor.motor_asyncio import AsyncIOMotorClient
+import sys
+from database import get_database
+from indexes import ensure_indexes, explain_queries
 
 async def check_db():
-    client = AsyncIOMotorClient("mongodb://localhost:27017")
-    db = client["submission_system"]
+    db = get_database()
     users = await db.users.find().to_list(100)
     submissions = await db.submissions.find().to_list(100)
     print("Users:", users)
     print("Submissions:", submissions)
 
+# Ensure indexes, then explain every API query shape; exit code 1 if any does a COLLSCAN
+async def check_indexes():
+    db = get_database()
+    await ensure_indexes(db)
+    report = await explain_queries(db)
+    for entry in report:
+        flag = "COLLSCAN" if entry["collscan"] else "ok"
+        print(f"[{flag}] {entry['collection']}: {entry['query']} -> {' > '.join(entry['stages'])}")
+    return 1 if any(entry["collscan"] for entry in report) else 0
+
 if __name__ == "__main__":
-    asyncio.run(check_db())
+    if "--explain" in sys.argv:
+        sys.exit(asyncio.run(check_indexes()))
+    asyncio.run(check_db())
\ No newline at end of file
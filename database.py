@@ -0,0 +1,195 @@
+import os
+import threading
+from pymongo import ReadPreference, WriteConcern
+from pymongo.monitoring import CommandListener, ConnectionPoolListener
+from motor.motor_asyncio import AsyncIOMotorClient
+from metrics import mongodb_command_duration_seconds, mongodb_command_failures_total
+
+# MongoDB settings, read from the environment
+MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+MONGODB_DB = os.getenv("MONGODB_DB", "submission_system")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "20000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+# Deadline of a whole operation (pymongo timeoutMS): server selection, the wait
+# for a connection, retries and the reply. The server gets the remaining time
+# as maxTimeMS, so it stops the operation too.
+MONGO_TIMEOUT_MS = int(os.getenv("MONGO_TIMEOUT_MS", "25000"))
+MONGO_READ_PREFERENCE = os.getenv("MONGO_READ_PREFERENCE", "primary")
+MONGO_WRITE_CONCERN = os.getenv("MONGO_WRITE_CONCERN", "1")  # "majority" or a number of nodes
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+# Counts connection pool events so pool size can be tuned from real usage
+class PoolStatsListener(ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pools = {}
+
+    def _pool(self, address):
+        key = f"{address[0]}:{address[1]}"
+        if key not in self.pools:
+            self.pools[key] = {"open": 0, "checked_out": 0, "waiting": 0, "checkout_failures": 0, "cleared": 0}
+        return self.pools[key]
+
+    def _update(self, address, **changes):
+        with self._lock:
+            pool = self._pool(address)
+            for name, delta in changes.items():
+                pool[name] += delta
+
+    def pool_created(self, event):
+        self._update(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._update(event.address, cleared=1)
+
+    def pool_closed(self, event):
+        with self._lock:
+            self.pools.pop(f"{event.address[0]}:{event.address[1]}", None)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_check_out_started(self, event):
+        self._update(event.address, waiting=1)
+
+    def connection_check_out_failed(self, event):
+        self._update(event.address, waiting=-1, checkout_failures=1)
+
+    def connection_checked_out(self, event):
+        self._update(event.address, waiting=-1, checked_out=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, checked_out=-1)
+
+    def snapshot(self):
+        with self._lock:
+            return {address: dict(pool) for address, pool in self.pools.items()}
+
+pool_stats = PoolStatsListener()
+
+# Records the duration of every MongoDB command per collection and command name
+class CommandMetricsListener(CommandListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def started(self, event):
+        # The collection name is only on the started event, keep it until the reply
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = collection
+
+    def _finish(self, event):
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), "")
+
+    def succeeded(self, event):
+        collection = self._finish(event)
+        mongodb_command_duration_seconds.observe(collection, event.command_name, value=event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._finish(event)
+        mongodb_command_duration_seconds.observe(collection, event.command_name, value=event.duration_micros / 1e6)
+        mongodb_command_failures_total.inc(collection, event.command_name)
+
+command_metrics = CommandMetricsListener()
+
+def parse_write_concern(value: str):
+    return WriteConcern(w=int(value) if value.isdigit() else value)
+
+# Build a client from the settings above (or explicit overrides)
+def create_client(uri: str = None, **overrides):
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "timeoutMS": MONGO_TIMEOUT_MS,
+        "event_listeners": [pool_stats, command_metrics],
+    }
+    options.update(overrides)
+    return AsyncIOMotorClient(uri or MONGODB_URI, **options)
+
+def configure_database(client):
+    return client.get_database(
+        MONGODB_DB,
+        read_preference=READ_PREFERENCES[MONGO_READ_PREFERENCE],
+        write_concern=parse_write_concern(MONGO_WRITE_CONCERN),
+    )
+
+# Process-wide client. It is created on connect() (FastAPI lifespan startup), or
+# on first use for scripts, so nothing connects at import time and every
+# uvicorn worker process gets its own pool.
+_client = None
+_database = None
+
+def connect():
+    global _client, _database
+    if _client is None:
+        _client = create_client()
+        _database = configure_database(_client)
+    return _database
+
+def close():
+    global _client, _database
+    if _client is not None:
+        _client.close()
+    _client = None
+    _database = None
+
+def get_database():
+    return _database if _database is not None else connect()
+
+def get_client():
+    get_database()
+    return _client
+
+async def ping():
+    await get_database().command("ping")
+
+def pool_settings():
+    return {
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "timeout_ms": MONGO_TIMEOUT_MS,
+        "read_preference": MONGO_READ_PREFERENCE,
+        "write_concern": MONGO_WRITE_CONCERN,
+    }
+
+# Stand-in for the database object that resolves to the current client on every
+# access, so modules can keep using `db.users` / `db["users"]`
+class LazyDatabase:
+    def __getattr__(self, name):
+        return getattr(get_database(), name)
+
+    def __getitem__(self, name):
+        return get_database()[name]
+
+db = LazyDatabase()
@@ -0,0 +1,140 @@
+# Submission change feed.
+#
+# On a replica set the broker tails a MongoDB change stream on submissions, so
+# every worker process sees writes made by all workers. On a standalone mongod
+# (or with a client that cannot open one, like mongomock) change streams are
+# not available; the broker then runs in "local" mode and the API publishes its
+# own writes through emit(), which only reaches clients connected to the same
+# process.
+import asyncio
+import logging
+from datetime import datetime
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+EVENT_QUEUE_SIZE = 256
+CHANGE_STREAM_RETRY_SECONDS = 5
+
+def make_event(event_type: str, submission_id, student_id=None, status=None):
+    return {
+        "type": event_type,
+        "submission_id": str(submission_id),
+        "student_id": student_id,
+        "status": status,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+def event_from_change(change):
+    operation = change["operationType"]
+    document = change.get("fullDocument") or change.get("fullDocumentBeforeChange") or {}
+    submission_id = change["documentKey"]["_id"]
+    if operation == "insert":
+        event_type = "create"
+    elif operation == "delete":
+        event_type = "delete"
+    elif operation in ("update", "replace"):
+        updated = change.get("updateDescription", {}).get("updatedFields", {})
+        if "status" in updated:
+            event_type = "status"
+        elif "comment_count" in updated:
+            event_type = "comment"
+        elif "escalated_at" in updated:
+            event_type = "escalate"
+        elif "reminder_sent_at" in updated:
+            event_type = "reminder"
+        else:
+            event_type = "update"
+    else:
+        return None
+    return make_event(event_type, submission_id, document.get("student_id"), document.get("status"))
+
+class EventBroker:
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self.mode = "local"
+        self._subscribers = set()
+        self._task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def publish(self, event):
+        for queue in list(self._subscribers):
+            if queue.full():
+                # Slow consumer: drop its oldest event rather than block writers
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    # Called by the API after each write; a no-op when the change stream delivers it
+    def emit(self, event_type: str, submission_id, student_id=None, status=None):
+        if self.mode == "local" and self._subscribers:
+            self.publish(make_event(event_type, submission_id, student_id, status))
+
+    def _publish_change(self, change):
+        event = event_from_change(change)
+        if event:
+            self.publish(event)
+
+    async def _open_stream(self, db, resume_after=None):
+        # try_next() runs the aggregate, so unsupported deployments fail here
+        options = {"full_document": "updateLookup", "resume_after": resume_after}
+        try:
+            # Pre-images (MongoDB 6.0+) give deletes a student_id for filtering
+            stream = db.submissions.watch(full_document_before_change="whenAvailable", **options)
+            change = await stream.try_next()
+        except OperationFailure:
+            stream = db.submissions.watch(**options)
+            change = await stream.try_next()
+        if change is not None:
+            self._publish_change(change)
+        return stream
+
+    async def _watch(self, db, stream):
+        while True:
+            try:
+                while True:
+                    change = await stream.try_next()
+                    if change is not None:
+                        self._publish_change(change)
+            except asyncio.CancelledError:
+                await stream.close()
+                raise
+            except PyMongoError as e:
+                logger.warning("Change stream interrupted, retrying: %s", e)
+                resume_token = stream.resume_token
+                await stream.close()
+                while True:
+                    await asyncio.sleep(CHANGE_STREAM_RETRY_SECONDS)
+                    try:
+                        stream = await self._open_stream(db, resume_token)
+                        break
+                    except PyMongoError as e:
+                        logger.warning("Change stream unavailable: %s", e)
+
+    async def start(self, db):
+        try:
+            stream = await self._open_stream(db)
+        except Exception as e:
+            # Standalone mongod, or a driver or mock without change streams
+            logger.info("Change streams unavailable, publishing local events only: %s", e)
+            self.mode = "local"
+            return
+        self.mode = "change_stream"
+        self._task = asyncio.create_task(self._watch(db, stream))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+broker = EventBroker()
@@ -1,10 +1,15 @@
 import streamlit as st
 import requests
 import json
+import time
 from datetime import datetime
+from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
 
 # Backend URL
 BACKEND_URL = "http://localhost:8888"
+# GET responses younger than this are reused without asking the backend
+CACHE_TTL_SECONDS = 5
 
 st.title("SOPAS")
 
@@ -15,6 +20,20 @@ if 'role' not in st.session_state:
     st.session_state.role = None
 if 'username' not in st.session_state:
     st.session_state.username = None
+if 'http_cache' not in st.session_state:
+    st.session_state.http_cache = {}
+# Local copy of the visible submissions by id, kept up to date through /submissions/changes
+if 'submissions' not in st.session_state:
+    st.session_state.submissions = {}
+    st.session_state.sync_token = None
+
+# One pooled HTTP session shared by all reruns, so connections are reused
+@st.cache_resource
+def get_http_session():
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+    return session
 
 def api_call(method, endpoint, data=None, headers=None):
     url = f"{BACKEND_URL}{endpoint}"
@@ -23,16 +42,79 @@ def api_call(method, endpoint, data=None, headers=None):
     if st.session_state.token:
         headers['Authorization'] = f"Bearer {st.session_state.token}"
     headers['Content-Type'] = 'application/json'
+    session = get_http_session()
     if method == 'GET':
-        response = requests.get(url, headers=headers)
+        response = session.get(url, headers=headers)
     elif method == 'POST':
-        response = requests.post(url, data=json.dumps(data), headers=headers)
+        response = session.post(url, data=json.dumps(data), headers=headers)
     elif method == 'PUT':
-        response = requests.put(url, data=json.dumps(data), headers=headers)
+        response = session.put(url, data=json.dumps(data), headers=headers)
     elif method == 'DELETE':
-        response = requests.delete(url, headers=headers)
+        response = session.delete(url, headers=headers)
+    if method != 'GET':
+        # Any change can affect cached lists
+        st.session_state.http_cache = {}
     return response
 
+# GET with a short-lived cache; after the TTL the cached ETag is revalidated
+# and a 304 reuses the cached body. Returns (status_code, data).
+def cached_get(endpoint):
+    cache = st.session_state.http_cache
+    entry = cache.get(endpoint)
+    if entry and time.monotonic() - entry['fetched_at'] < CACHE_TTL_SECONDS:
+        return 200, entry['data']
+    headers = {}
+    if entry and entry['etag']:
+        headers['If-None-Match'] = entry['etag']
+    response = api_call('GET', endpoint, headers=headers)
+    if response.status_code == 304 and entry:
+        entry['fetched_at'] = time.monotonic()
+        return 200, entry['data']
+    if response.status_code != 200:
+        return response.status_code, None
+    data = response.json()
+    cache[endpoint] = {'etag': response.headers.get('ETag'), 'data': data, 'fetched_at': time.monotonic()}
+    return 200, data
+
+# Fetch only what changed since the last sync and apply it to the local copy.
+# Returns (status_code, submissions oldest first).
+def sync_submissions():
+    local = st.session_state.submissions
+    while True:
+        endpoint = '/submissions/changes'
+        if st.session_state.sync_token:
+            endpoint += f"?{urlencode({'since': st.session_state.sync_token})}"
+        response = api_call('GET', endpoint)
+        if response.status_code == 410:
+            # Token too old to trust: start over with a full load
+            local.clear()
+            st.session_state.sync_token = None
+            continue
+        if response.status_code != 200:
+            return response.status_code, None
+        data = response.json()
+        for sub in data['changed']:
+            local[sub['_id']] = sub
+        for tombstone in data['deleted']:
+            local.pop(tombstone['_id'], None)
+        st.session_state.sync_token = data['next']
+        if not data['more']:
+            break
+    return 200, sorted(local.values(), key=lambda sub: (sub['created_at'], sub['_id']))
+
+def reset_sync():
+    st.session_state.submissions = {}
+    st.session_state.sync_token = None
+
+# event_datetime comes back as ISO 8601 (older records: "YYYY-MM-DD HH:MM:SS")
+def parse_event_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
 # Login/Register
 if st.session_state.token is None:
     tab1, tab2 = st.tabs(["Login", "Register"])
@@ -77,6 +159,8 @@ else:
         st.session_state.token = None
         st.session_state.role = None
         st.session_state.username = None
+        st.session_state.http_cache = {}
+        reset_sync()
         st.rerun()
 
     # Submissions
@@ -93,18 +177,29 @@ else:
         organization_name = st.text_input("Name of the Organization")
         event_date = st.date_input("Event Date")
         event_time = st.time_input("Event Time")
+        duration_minutes = st.number_input("Duration (minutes)", min_value=1, max_value=1440, value=120, step=15)
         if st.button("Submit"):
-            response = api_call('POST', '/submissions', {"title": title, "content": content, "project_head": project_head, "budget": budget, "venue": venue, "organization_name": organization_name, "event_date": str(event_date), "event_time": str(event_time)})
+            response = api_call('POST', '/submissions', {"title": title, "content": content, "project_head": project_head, "budget": budget, "venue": venue, "organization_name": organization_name, "event_date": str(event_date), "event_time": str(event_time), "duration_minutes": duration_minutes})
             if response.status_code == 200:
                 st.success("Submission created!")
                 st.rerun()
             else:
                 st.error("Failed to create submission")
 
+    # Search submissions
+    search_query = st.text_input("Search submissions", placeholder='Words or "exact phrase"')
+    if search_query:
+        search_status, results = cached_get(f"/submissions/search?{urlencode({'q': search_query})}")
+        if search_status == 200:
+            st.write(f"{len(results)} result(s)")
+            for result in results:
+                st.write(f"- {result['title']} ({result.get('organization_name', 'N/A')}) - {result['status']}")
+        else:
+            st.error("Search failed")
+
     # Load submissions
-    response = api_call('GET', '/submissions')
-    if response.status_code == 200:
-        submissions = response.json()
+    status_code, submissions = sync_submissions()
+    if status_code == 200:
         for sub in submissions:
             with st.expander(f"{sub['title']} - {sub['status']}"):
                 st.write(f"Submitted by: {sub['student_id']}")
@@ -113,12 +208,25 @@ else:
                 st.write(f"Budget: {sub.get('budget', 'N/A')}")
                 st.write(f"Venue: {sub.get('venue', 'N/A')}")
                 st.write(f"Organization Name: {sub.get('organization_name', 'N/A')}")
-                st.write(f"Event Date & Time: {sub.get('event_datetime', 'N/A')}")
+                event_start = parse_event_datetime(sub.get('event_datetime'))
+                st.write(f"Event Date & Time: {event_start.strftime('%Y-%m-%d %H:%M') if event_start else 'N/A'}")
                 st.write(f"Status: {sub['status']}")
-                if sub['comments']:
-                    st.write("Comments:")
-                    for comment in sub['comments']:
-                        st.write(f"- {comment['comment']} (by {comment['admin_id']})")
+                if sub.get('escalated_at') and sub['status'] == 'pending':
+                    st.warning(f"Pending since {sub['created_at'][:10]}, awaiting review")
+                if sub.get('reminder_sent_at') and sub['status'] == 'approved':
+                    st.info("Event starts soon")
+                # Comments are loaded only for the submissions the user opens,
+                # not for every listed one on each rerun
+                if sub.get('comment_count') and st.toggle(f"Show comments ({sub['comment_count']})", key=f"comments_{sub['_id']}"):
+                    comments_status, comments = cached_get(f"/submissions/{sub['_id']}/comments")
+                    if comments_status == 200:
+                        st.write("Comments:")
+                        for comment in comments:
+                            st.write(f"- {comment['comment']} (by {comment['admin_id']})")
+                if sub.get('attachments'):
+                    st.write("Attachments:")
+                    for attachment in sub['attachments']:
+                        st.write(f"- {attachment['filename']} ({attachment['length'] // 1024} KB)")
 
                 # Edit (students, all status)
                 if st.session_state.role == "student" and sub['student_id'] == st.session_state.username:
@@ -130,31 +238,40 @@ else:
                         new_venue = st.text_input("New Venue", value=sub.get('venue', ''))
                         new_organization_name = st.text_input("New Name of the Organization", value=sub.get('organization_name', ''))
                         
-                        # Parse existing datetime
-                        existing_datetime = sub.get('event_datetime', '')
-
-                        if existing_datetime:
-                            
-                            try:
-                                date_part, time_part = existing_datetime.split(' ')
-                                new_event_date = st.date_input("New Event Date", value=date_part)
-                                new_event_time = st.time_input("New Event Time", value=time_part)
-                            except:
-                                new_event_date = st.date_input("New Event Date")
-                                new_event_time = st.time_input("New Event Time")
+                        # Prefill with the existing event datetime
+                        if event_start:
+                            new_event_date = st.date_input("New Event Date", value=event_start.date())
+                            new_event_time = st.time_input("New Event Time", value=event_start.time())
                         else:
                             new_event_date = st.date_input("New Event Date")
                             new_event_time = st.time_input("New Event Time")
-
+                        new_duration = st.number_input("New Duration (minutes)", min_value=1, max_value=1440, step=15, value=int(sub.get('duration_minutes') or 120))
 
                         if st.form_submit_button("Update"):
-                            edit_response = api_call('PUT', f"/submissions/{sub['_id']}", {"title": new_title, "content": new_content, "project_head": new_project_head, "budget": new_budget, "venue": new_venue, "organization_name": new_organization_name, "event_date": str(new_event_date), "event_time": str(new_event_time)})
+                            edit_response = api_call('PUT', f"/submissions/{sub['_id']}", {"title": new_title, "content": new_content, "project_head": new_project_head, "budget": new_budget, "venue": new_venue, "organization_name": new_organization_name, "event_date": str(new_event_date), "event_time": str(new_event_time), "duration_minutes": new_duration}, headers={'If-Match': f'"{sub.get("version", 0)}"'})
                             if edit_response.status_code == 200:
                                 st.success("Updated!")
                                 st.rerun()
+                            elif edit_response.status_code == 412:
+                                st.error("This submission was changed by someone else. Reload to see the latest version.")
                             else:
                                 st.error("Update failed")
 
+                # Attach a file (students, own submissions)
+                if st.session_state.role == "student" and sub['student_id'] == st.session_state.username:
+                    upload = st.file_uploader("Attach a file", key=f"upload_{sub['_id']}")
+                    if upload is not None and st.button("Upload", key=f"upload_button_{sub['_id']}"):
+                        upload_response = get_http_session().post(
+                            f"{BACKEND_URL}/submissions/{sub['_id']}/attachments",
+                            files={"file": (upload.name, upload, upload.type or "application/octet-stream")},
+                            headers={'Authorization': f"Bearer {st.session_state.token}"}
+                        )
+                        if upload_response.status_code == 200:
+                            st.success("Attached!")
+                            st.rerun()
+                        else:
+                            st.error(f"Upload failed: {upload_response.json().get('detail', upload_response.status_code)}")
+
                 # Delete (students only)
                 if st.session_state.role == "student" and sub['student_id'] == st.session_state.username:
                     if st.button("Delete Submission", key=f"delete_{sub['_id']}"):
@@ -167,6 +284,18 @@ else:
 
                 # Admin functions
                 if st.session_state.role == "admin":
+                    # Venue/time clashes with other approved or pending submissions
+                    if event_start and st.button("Check Conflicts", key=f"conflicts_{sub['_id']}"):
+                        params = urlencode({"venue": sub.get('venue', ''), "event_date": event_start.strftime('%Y-%m-%d'), "event_time": event_start.strftime('%H:%M:%S'), "duration_minutes": sub.get('duration_minutes') or 120, "exclude_id": sub['_id']})
+                        conflicts_response = api_call('GET', f"/submissions/conflicts?{params}")
+                        if conflicts_response.status_code != 200:
+                            st.error("Failed to check conflicts")
+                        elif conflicts_response.json():
+                            for conflict in conflicts_response.json():
+                                st.warning(f"Conflicts with {conflict['title']} ({conflict.get('organization_name', 'N/A')}) - {conflict['status']}")
+                        else:
+                            st.success("No conflicts")
+
                     # Add comment
                     with st.form(key=f"comment_{sub['_id']}"):
                         comment_text = st.text_input("Add Comment")
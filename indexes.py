@@ -0,0 +1,110 @@
+import logging
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ASCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from models import TOMBSTONE_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# Indexes required by the queries the API issues, per collection
+INDEXES = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    ],
+    "submissions": [
+        IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at_id"),
+        IndexModel([("student_id", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], name="student_created_at"),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], name="status_created_at"),
+        IndexModel([("organization_name", ASCENDING), ("created_at", ASCENDING), ("_id", ASCENDING)], name="organization_created_at"),
+        IndexModel([("event_datetime", ASCENDING)], name="event_datetime"),
+        IndexModel([("venue", ASCENDING), ("event_datetime", ASCENDING)], name="venue_event_datetime"),
+        IndexModel([("seq", ASCENDING)], name="seq"),
+        IndexModel([("student_id", ASCENDING), ("seq", ASCENDING)], name="student_seq"),
+        IndexModel(
+            [("title", TEXT), ("content", TEXT), ("venue", TEXT), ("organization_name", TEXT), ("project_head", TEXT)],
+            weights={"title": 10, "organization_name": 5, "project_head": 3, "venue": 3, "content": 1},
+            name="submission_text"
+        ),
+    ],
+    "comments": [
+        IndexModel([("submission_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="submission_timestamp"),
+    ],
+    "submission_events": [
+        IndexModel([("submission_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="submission_timestamp"),
+        IndexModel([("timestamp", ASCENDING), ("_id", ASCENDING)], name="timestamp_id"),
+    ],
+    # GridFS files of the attachments, looked up per submission on delete
+    "attachments.files": [
+        IndexModel([("metadata.submission_id", ASCENDING)], name="submission_id"),
+    ],
+    "submission_tombstones": [
+        IndexModel([("seq", ASCENDING)], name="seq"),
+        IndexModel([("student_id", ASCENDING), ("seq", ASCENDING)], name="student_seq"),
+        IndexModel([("deleted_at", ASCENDING)], expireAfterSeconds=TOMBSTONE_RETENTION_DAYS * 86400, name="deleted_at_ttl"),
+    ],
+}
+
+# Every query shape the API issues: (name, collection, filter, sort)
+SUBMISSION_SORT = [("created_at", ASCENDING), ("_id", ASCENDING)]
+QUERY_SHAPES = [
+    ("user by username", "users", {"username": "x"}, None),
+    ("submission by id and owner", "submissions", {"_id": None, "student_id": "x"}, None),
+    ("admin submission list", "submissions", {}, SUBMISSION_SORT),
+    ("student submission list", "submissions", {"student_id": "x"}, SUBMISSION_SORT),
+    ("submissions by status", "submissions", {"status": "pending"}, SUBMISSION_SORT),
+    ("submissions by organization", "submissions", {"organization_name": "x"}, SUBMISSION_SORT),
+    ("text search", "submissions", {"$text": {"$search": "x"}}, None),
+    ("upcoming events", "submissions", {"event_datetime": {"$gte": datetime(2000, 1, 1)}}, None),
+    ("venue conflicts", "submissions", {"venue": "x", "event_datetime": {"$gt": datetime(2000, 1, 1), "$lt": datetime(2000, 1, 2)}}, None),
+    ("comments of a submission", "comments", {"submission_id": None}, [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+    ("history of a submission", "submission_events", {"submission_id": None}, [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+    ("attachments of a submission", "attachments.files", {"metadata.submission_id": None}, None),
+    ("admin changes since", "submissions", {"seq": {"$gt": 0}}, [("seq", ASCENDING)]),
+    ("student changes since", "submissions", {"student_id": "x", "seq": {"$gt": 0}}, [("seq", ASCENDING)]),
+    ("admin deletions since", "submission_tombstones", {"seq": {"$gt": 0}}, [("seq", ASCENDING)]),
+    ("student deletions since", "submission_tombstones", {"student_id": "x", "seq": {"$gt": 0}}, [("seq", ASCENDING)]),
+    ("stale pending sweep", "submissions", {"status": "pending", "created_at": {"$lt": datetime(2000, 1, 1)}}, SUBMISSION_SORT),
+    ("event reminder sweep", "submissions", {"status": "approved", "event_datetime": {"$gte": datetime(2000, 1, 1), "$lt": datetime(2000, 1, 3)}},
+     [("event_datetime", ASCENDING), ("_id", ASCENDING)]),
+    ("tombstone purge", "submission_tombstones", {"deleted_at": {"$lt": datetime(2000, 1, 1)}}, [("deleted_at", ASCENDING), ("_id", ASCENDING)]),
+    ("audit event purge", "submission_events", {"timestamp": {"$lt": datetime(2000, 1, 1)}}, [("timestamp", ASCENDING), ("_id", ASCENDING)]),
+]
+
+# Create the declared indexes (no-op for indexes that already exist)
+async def ensure_indexes(db):
+    for collection, indexes in INDEXES.items():
+        try:
+            await db[collection].create_indexes(indexes)
+        except OperationFailure as e:
+            # e.g. duplicate usernames already stored; keep serving but make it visible
+            logger.error("Could not create indexes on %s: %s", collection, e)
+
+def _plan_stages(plan):
+    stages = [plan.get("stage")]
+    if "inputStage" in plan:
+        stages += _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    return stages
+
+# Run explain() for every query shape and report the winning plan stages
+async def explain_queries(db):
+    report = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        # None marks an ObjectId placeholder
+        query = {k: (ObjectId() if v is None else v) for k, v in query.items()}
+        cursor = db[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = await cursor.explain()
+        winning = plan["queryPlanner"]["winningPlan"]
+        # Newer servers wrap the classic plan in "queryPlan"
+        stages = _plan_stages(winning.get("queryPlan", winning))
+        report.append({
+            "query": name,
+            "collection": collection,
+            "stages": stages,
+            "collscan": "COLLSCAN" in stages,
+        })
+    return report
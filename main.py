@@ -1,17 +1,87 @@
 # Import necessary modules and models from models.py
-from fastapi import FastAPI, HTTPException, Depends, status
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from bson import ObjectId
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-import uvicorn
+from typing import List, Optional
+import asyncio
+import csv
+import io
+import json
+import os
+from pymongo.errors import DuplicateKeyError
 from models import (
-    User, LoginUser, Submission, Comment, StatusUpdate,
-    verify_password, get_password_hash, create_access_token,
-    get_current_user, get_user_role, ACCESS_TOKEN_EXPIRE_MINUTES, db
+    User, LoginUser, Submission, Comment, StatusUpdate, RoleUpdate, Principal,
+    StatusBatchItem, CommentBatchItem, MAX_BATCH_SIZE,
+    submission_fields, new_submission_document, new_comment_document, new_tombstone_document,
+    comment_counter_update, change_stamp, stamped, next_change_seqs, parse_object_id, etag, parse_if_match, version_filter,
+    LIST_VALIDATOR_PROJECTION, list_etag, etag_matches,
+    parse_event_datetime, event_duration, parse_date, MAX_EVENT_DURATION_MINUTES,
+    get_password_hash_async, verify_and_update_password_async, hash_pool, create_access_token,
+    get_current_principal, token_subject, set_user_role, role_cache, ACCESS_TOKEN_EXPIRE_MINUTES,
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SUBMISSION_FIELDS, SUMMARY_FIELDS,
+    encode_cursor, after_cursor_filter, encode_change_token, decode_change_token, TOMBSTONE_RETENTION_DAYS,
+    SubmissionOut, SearchResultOut, CommentOut, UserOut, SubmissionEventOut, SubmissionChangesOut, AttachmentOut
 )
+from responses import BSONResponse, CachedStaticFiles, bson_dumps
+from indexes import ensure_indexes, explain_queries
+from stats import ROLLUP_PROJECTION, update_rollups, rebuild_rollups, ensure_rollups, get_stats
+from events import broker
+from scheduler import scheduler, SCHEDULER_ENABLED
+from audit import audit_log, make_audit_event, diff, AUDITED_FIELDS
+from attachments import (
+    receive_attachment, attachment_response, delete_attachment_file, delete_submission_attachments, MAX_ATTACHMENTS
+)
+from ratelimit import (
+    limiter, limit_ip, RateLimitMiddleware, LOGIN_IP_LIMIT, LOGIN_USER_LIMIT, REGISTER_IP_LIMIT
+)
+from database import db
+import database
+import metrics
+import storage
+
+# Index creation and the rollup bootstrap only need to run once per deployment.
+# server.py runs them before starting the workers and sets SKIP_STARTUP_TASKS=1.
+SKIP_STARTUP_TASKS = os.getenv("SKIP_STARTUP_TASKS", "0") == "1"
+
+async def run_startup_tasks():
+    # The memory and SQLite engines create their own indexes
+    if storage.is_mongo():
+        await ensure_indexes(db)
+        await ensure_rollups(db)
+
+# Startup: open this process's storage (the MongoDB client, by default) and
+# make sure every index the queries below rely on exists. Shutdown: release
+# the pools.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    store = storage.get_store()
+    store.connect()
+    if not SKIP_STARTUP_TASKS:
+        await run_startup_tasks()
+    if storage.is_mongo():
+        await broker.start(db)
+    await audit_log.start()
+    if SCHEDULER_ENABLED:
+        scheduler.start()
+    yield
+    # Before the audit log, so the events of an interrupted job run are flushed
+    await scheduler.stop()
+    await broker.stop()
+    await audit_log.stop()
+    hash_pool.shutdown()
+    store.close()
+
+# Endpoints that rely on MongoDB features (text indexes, aggregation, explain)
+def require_mongo(feature: str):
+    if not storage.is_mongo():
+        raise HTTPException(status_code=501, detail=f"{feature} requires the MongoDB storage engine")
 
 # Create FastAPI app with tags for documentations
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=BSONResponse,
     openapi_tags=[
         {
             "name": "Authentication & Users",
@@ -33,75 +103,594 @@ app = FastAPI(
             "name": "Delete",
             "description": "Endpoints for deleting submissions.",
         },
+        {
+            "name": "Attachments",
+            "description": "Upload and download files attached to submissions.",
+        },
+        {
+            "name": "Statistics",
+            "description": "Aggregated dashboard statistics for administrators.",
+        },
+        {
+            "name": "Health",
+            "description": "Readiness checks for load balancers and orchestration.",
+        },
+        {
+            "name": "Admin",
+            "description": "Diagnostic endpoints for administrators.",
+        },
     ]
 
 )
+# Added first so it runs inside MetricsMiddleware and 429s are still counted
+app.add_middleware(RateLimitMiddleware, token_subject=token_subject)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Pool gauges are sampled when /metrics is scraped
+hash_pool_queue_depth = metrics.Gauge("password_hash_queue_depth", "Password hash requests waiting for a worker.")
+hash_pool_in_flight = metrics.Gauge("password_hash_in_flight", "Password hashes currently running.")
+audit_queue_depth = metrics.Gauge("audit_queue_depth", "Audit events waiting to be written.")
+mongodb_pool_connections = metrics.Gauge("mongodb_pool_connections", "MongoDB pool connections by state.", ["address", "state"])
+
+def collect_pool_metrics():
+    stats = hash_pool.stats()
+    hash_pool_queue_depth.set(value=stats["queue_depth"])
+    hash_pool_in_flight.set(value=stats["in_flight"])
+    audit_queue_depth.set(value=audit_log.queue_depth())
+    mongodb_pool_connections.clear()
+    for address, pool in database.pool_stats.snapshot().items():
+        for state in ["open", "checked_out", "waiting"]:
+            mongodb_pool_connections.set(address, state, value=pool[state])
+
+metrics.REGISTRY.add_collector(collect_pool_metrics)
 
 # API Endpoints (Routes)
 
 # User registration endpoint
-@app.post("/register", tags=["Authentication & Users"])
+@app.post("/register", tags=["Authentication & Users"], dependencies=[Depends(limit_ip("register", REGISTER_IP_LIMIT))])
 async def register(user: User):
-    if await db.users.find_one({"username": user.username}):
+    if await storage.users.get(user.username, {"_id": 1}):
+        raise HTTPException(status_code=400, detail="Username already registered")
+    hashed_password = await get_password_hash_async(user.password)
+    user_dict = {"username": user.username, "password": hashed_password, "role": user.role, "version": 1}
+    try:
+        await storage.users.create(user_dict)
+    except DuplicateKeyError:
+        # Concurrent registration of the same username, caught by the unique index
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
-    user_dict = {"username": user.username, "password": hashed_password, "role": user.role}
-    await db.users.insert_one(user_dict)
     return {"message": "User registered successfully"}
 
 # User login endpoint
-@app.post("/login", tags=["Authentication & Users"])
+@app.post("/login", tags=["Authentication & Users"], dependencies=[Depends(limit_ip("login", LOGIN_IP_LIMIT))])
 async def login(user: LoginUser):
-    db_user = await db.users.find_one({"username": user.username})
-    if not db_user or not verify_password(user.password, db_user["password"]):
+    # Per username as well, so guessing one account's password from many IPs is throttled
+    await limiter.check("login", f"user:{user.username.lower()}", LOGIN_USER_LIMIT)
+    db_user = await storage.users.get(user.username)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    valid, new_hash = await verify_and_update_password_async(user.password, db_user["password"])
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
+    if new_hash:
+        # Stored hash used outdated settings (e.g. fewer rounds), upgrade it transparently
+        await storage.users.set_password(user.username, new_hash)
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(data={"sub": user.username}, expires_delta=access_token_expires)
+    role_cache.set(user.username, db_user["role"], db_user.get("version", 0))
+    access_token = create_access_token(
+        data={"sub": user.username, "ver": db_user.get("version", 0)},
+        expires_delta=access_token_expires
+    )
     return {"access_token": access_token, "token_type": "bearer"}
 
+# Fields read back from writes: what the rollups need plus owner and version for events
+WRITE_PROJECTION = {**ROLLUP_PROJECTION, "student_id": 1, "version": 1}
+# Student edits also read back the old values for the audit diff
+EDIT_PROJECTION = {**WRITE_PROJECTION, **{f: 1 for f in AUDITED_FIELDS}}
+
 # Create new submission (students only)
 @app.post("/submissions", tags=["Create and Read Submissions"])
-async def create_submission(submission: Submission, current_user: str = Depends(get_current_user)):
-    role = await get_user_role(current_user)
-    if role != "student":
+async def create_submission(submission: Submission, principal: Principal = Depends(get_current_principal)):
+    if principal.role != "student":
         raise HTTPException(status_code=403, detail="Only students can create submissions")
-    submission_dict = {
-        "student_id": current_user,
-        "title": submission.title,
-        "content": submission.content,
-        "project_head": submission.project_head,
-        "budget": submission.budget,
-        "venue": submission.venue,
-        "organization_name": submission.organization_name,
-        "event_datetime": f"{submission.event_date} {submission.event_time}",
-        "status": "pending",
-        "comments": [],
-        "created_at": datetime.utcnow()
-    }
-    result = await db.submissions.insert_one(submission_dict)
-    return {"id": str(result.inserted_id)}
+    submission_dict = new_submission_document(submission, principal.username)
+    (seq,) = await next_change_seqs()
+    submission_dict.update(change_stamp(seq, submission_dict["created_at"]))
+    submission_id = await storage.submissions.create(submission_dict)
+    await update_rollups(db, [(None, submission_dict)])
+    broker.emit("create", submission_id, principal.username, "pending")
+    await audit_log.record(make_audit_event(
+        "create", submission_id, principal.username, principal.username,
+        diff(None, submission_dict, AUDITED_FIELDS), 1
+    ))
+    return {"id": str(submission_id)}
+
+# Filters shared by the submission list, search and export endpoints
+def submission_filters(
+    principal: Principal,
+    status: Optional[str] = None,
+    organization_name: Optional[str] = None,
+    student_id: Optional[str] = None,
+    event_from: Optional[str] = None,
+    event_to: Optional[str] = None
+):
+    query = {}
+    if principal.role == "admin":
+        if student_id:
+            query["student_id"] = student_id
+    else:
+        query["student_id"] = principal.username
+    if status:
+        query["status"] = status
+    if organization_name:
+        query["organization_name"] = organization_name
+    if event_from or event_to:
+        query["event_datetime"] = {}
+        if event_from:
+            query["event_datetime"]["$gte"] = parse_date(event_from)
+        if event_to:
+            # Include the whole end day
+            query["event_datetime"]["$lt"] = parse_date(event_to) + timedelta(days=1)
+    return query
 
 # Get submissions (admins see all, students see their own)
-@app.get("/submissions", tags=["Create and Read Submissions"])
-async def get_submissions(current_user: str = Depends(get_current_user)):
-    role = await get_user_role(current_user)
-    if role == "admin":
-        submissions = await db.submissions.find().to_list(100)
+# Results are paged by a cursor on (created_at, _id); the cursor for the next
+# page is returned in the X-Next-Cursor header so the body stays a plain list.
+# The page has an ETag; a matching If-None-Match is answered with 304 after
+# reading only ids and versions instead of the full documents.
+@app.get("/submissions", tags=["Create and Read Submissions"], response_model=List[SubmissionOut])
+async def get_submissions(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    status: Optional[str] = None,
+    organization_name: Optional[str] = None,
+    student_id: Optional[str] = None,
+    event_from: Optional[str] = None,
+    event_to: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$"),
+    fields: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    principal: Principal = Depends(get_current_principal)
+):
+    query = submission_filters(principal, status, organization_name, student_id, event_from, event_to)
+    if after:
+        query = {"$and": [query, after_cursor_filter(after)]}
+
+    # Field projection: explicit fields win over the summary view
+    projection = None
+    if fields:
+        requested = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in requested if f not in SUBMISSION_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        projection = {f: 1 for f in requested}
+    elif view == "summary":
+        projection = {f: 1 for f in SUMMARY_FIELDS}
+    if projection is not None:
+        # Always returned: created_at builds the next cursor, version and
+        # comment_count build the ETag
+        projection.update({"created_at": 1, "version": 1, "comment_count": 1})
+
+    sort = [("created_at", 1), ("_id", 1)]
+    etag_key = f"{principal.username}|{principal.role}|{request.url.query}"
+    if if_none_match:
+        validators = await storage.submissions.list(query, LIST_VALIDATOR_PROJECTION, sort, limit)
+        tag = list_etag(etag_key, validators)
+        if etag_matches(if_none_match, tag):
+            headers = {"ETag": tag}
+            if len(validators) == limit:
+                headers["X-Next-Cursor"] = encode_cursor(validators[-1]["created_at"], validators[-1]["_id"])
+            return Response(status_code=304, headers=headers)
+
+    submissions = await storage.submissions.list(query, projection, sort, limit)
+    headers = {"ETag": list_etag(etag_key, submissions)}
+    if len(submissions) == limit:
+        last = submissions[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last["created_at"], last["_id"])
+    return BSONResponse(submissions, headers=headers)
+
+# Incremental sync (admins see all, students their own): the submissions
+# created or changed and the ids of those deleted since the token, in sequence
+# order. Clients keep a local copy, apply "changed" and "deleted", and pass
+# "next" as since on the following call; without since everything is returned.
+# A write reserves its sequence value just before it runs, so a lower value can
+# still be in flight when a higher one is visible: the token stops short of
+# changes from the last CHANGES_SETTLE_SECONDS, which are sent again next time
+# (applying a change twice is harmless). The window must cover the longest a
+# write can take after its reservation. On MongoDB every operation, with its
+# server selection, connection wait and retries, is bounded by
+# MONGO_TIMEOUT_MS, and the server is told to stop at the same deadline; the
+# extra seconds cover clock differences between workers. A write the server
+# still commits after that (rare) can be missed by clients until their next
+# full reload.
+CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", str(database.MONGO_TIMEOUT_MS / 1000 + 5)))
+
+@app.get("/submissions/changes", tags=["Create and Read Submissions"], response_model=SubmissionChangesOut)
+async def get_submission_changes(
+    since: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    principal: Principal = Depends(get_current_principal)
+):
+    now = datetime.utcnow()
+    seq = 0
+    if since:
+        seq, complete_at = decode_change_token(since)
+        if complete_at < now - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+            raise HTTPException(status_code=410, detail="Sync token expired, reload all submissions")
+    query = {"seq": {"$gt": seq}}
+    if principal.role != "admin":
+        query["student_id"] = principal.username
+    changed = await storage.submissions.list(query, None, [("seq", 1)], limit)
+    deleted = await storage.submission_tombstones.list(query, limit)
+    page = sorted(changed + deleted, key=lambda doc: doc["seq"])[:limit]
+
+    settled = now - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    next_seq = seq
+    for doc in page:
+        if doc.get("deleted_at", doc.get("updated_at")) > settled:
+            break
+        next_seq = doc["seq"]
+    # Every change after next_seq is newer than complete_at
+    complete_at = settled
+    if len(page) == limit:
+        complete_at = min(settled, page[-1].get("deleted_at", page[-1].get("updated_at")))
+    return BSONResponse({
+        "changed": [doc for doc in page if "deleted_at" not in doc],
+        "deleted": [doc for doc in page if "deleted_at" in doc],
+        "next": encode_change_token(next_seq, complete_at),
+        "more": len(page) == limit and next_seq > seq,
+    })
+
+# Full-text search over title, content, venue, organization and project head
+# (admins search all, students their own). Supports MongoDB text syntax:
+# terms, "exact phrases" and -excluded terms. Ranked by relevance; offsets
+# are capped because skipping deep into a ranked result gets slower.
+MAX_SEARCH_OFFSET = 1000
+
+@app.get("/submissions/search", tags=["Create and Read Submissions"], response_model=List[SearchResultOut])
+async def search_submissions(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    status: Optional[str] = None,
+    organization_name: Optional[str] = None,
+    student_id: Optional[str] = None,
+    event_from: Optional[str] = None,
+    event_to: Optional[str] = None,
+    principal: Principal = Depends(get_current_principal)
+):
+    require_mongo("Full-text search")
+    query = submission_filters(principal, status, organization_name, student_id, event_from, event_to)
+    query["$text"] = {"$search": q}
+    projection = {f: 1 for f in SUMMARY_FIELDS}
+    projection["score"] = {"$meta": "textScore"}
+    cursor = db.submissions.find(query, projection).sort(
+        [("score", {"$meta": "textScore"}), ("_id", 1)]
+    ).skip(offset).limit(limit)
+    return BSONResponse(await cursor.to_list(limit))
+
+# Export submissions as CSV or NDJSON. Rows are streamed from the cursor one
+# batch at a time, so memory use does not depend on the number of rows.
+EXPORT_BATCH_SIZE = 1000
+MAX_EXPORT_BATCH_SIZE = 10000
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    return value
+
+def csv_value(value):
+    # Nested values (attachment metadata) as JSON text in the cell
+    if isinstance(value, (list, dict)):
+        return bson_dumps(value).decode()
+    return value
+
+@app.get("/submissions/export", tags=["Create and Read Submissions"])
+async def export_submissions(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    fields: Optional[str] = None,
+    batch_size: int = Query(EXPORT_BATCH_SIZE, ge=1, le=MAX_EXPORT_BATCH_SIZE),
+    status: Optional[str] = None,
+    organization_name: Optional[str] = None,
+    student_id: Optional[str] = None,
+    event_from: Optional[str] = None,
+    event_to: Optional[str] = None,
+    principal: Principal = Depends(get_current_principal)
+):
+    query = submission_filters(principal, status, organization_name, student_id, event_from, event_to)
+    columns = [f.strip() for f in fields.split(",") if f.strip()] if fields else list(SUBMISSION_FIELDS)
+    unknown = [f for f in columns if f not in SUBMISSION_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    columns = ["_id"] + [f for f in columns if f != "_id"]
+    cursor = storage.submissions.iterate(query, {f: 1 for f in columns}, [("created_at", 1), ("_id", 1)], batch_size)
+
+    async def rows():
+        buffer = []
+        async for sub in cursor:
+            buffer.append([export_value(sub.get(f)) for f in columns])
+            if len(buffer) >= batch_size:
+                yield buffer
+                buffer = []
+        if buffer:
+            yield buffer
+
+    async def csv_stream():
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        async for batch in rows():
+            writer.writerows([csv_value(value) for value in row] for row in batch)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        if out.tell():
+            yield out.getvalue()
+
+    async def ndjson_stream():
+        async for batch in rows():
+            yield b"".join(bson_dumps(dict(zip(columns, row))) + b"\n" for row in batch)
+
+    if format == "csv":
+        body, media_type = csv_stream(), "text/csv"
     else:
-        submissions = await db.submissions.find({"student_id": current_user}).to_list(100)
-    for sub in submissions:
-        sub["_id"] = str(sub["_id"])
-    return submissions
+        body, media_type = ndjson_stream(), "application/x-ndjson"
+    filename = f"submissions-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(body, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# Approved and pending submissions at a venue whose time overlaps the given
+# slot (admins only: the result shows other organizations' proposals). Events are at most MAX_EVENT_DURATION_MINUTES long, so candidates
+# start within that window before the slot: a bounded range on the
+# venue+event_datetime index.
+@app.get("/submissions/conflicts", tags=["Create and Read Submissions"], response_model=List[SubmissionOut])
+async def get_conflicts(
+    venue: str,
+    event_date: str,
+    event_time: str,
+    duration_minutes: Optional[int] = None,
+    exclude_id: Optional[str] = None,
+    principal: Principal = Depends(get_current_principal)
+):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can check venue conflicts")
+    start = parse_event_datetime(event_date, event_time)
+    end = start + timedelta(minutes=event_duration(duration_minutes))
+    query = {
+        "venue": venue,
+        "event_datetime": {"$gt": start - timedelta(minutes=MAX_EVENT_DURATION_MINUTES), "$lt": end},
+        "event_end": {"$gt": start},
+        "status": {"$in": ["approved", "pending"]},
+    }
+    if exclude_id:
+        oid = parse_object_id(exclude_id)
+        if oid is None:
+            raise HTTPException(status_code=400, detail="Invalid submission ID")
+        query["_id"] = {"$ne": oid}
+    projection = {"title": 1, "organization_name": 1, "venue": 1, "event_datetime": 1, "event_end": 1, "status": 1}
+    return BSONResponse(await storage.submissions.list(query, projection, [("event_datetime", 1)]))
+
+# Batch endpoints
+# Each batch is validated item by item, then the valid items are written:
+# created submissions in one unordered insert, status updates and comments with
+# one conditional write per item. The response has one result per input item.
+
+# Concurrent writes of a batch that needs one write per item
+BATCH_WRITE_CONCURRENCY = 16
+
+def check_batch_size(items: list):
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Batch exceeds {MAX_BATCH_SIZE} items")
+
+# One conditional write per (query, make_update) of a batch, at most
+# BATCH_WRITE_CONCURRENCY at a time. make_update(now) builds the update; each
+# write reserves its seq right before it is sent, so it lands within
+# CHANGES_SETTLE_SECONDS however long it queued. Returns per operation
+# (document before the write or None if nothing matched, time of the write),
+# or the exception it raised.
+async def write_each(operations: list, projection: dict):
+    semaphore = asyncio.Semaphore(BATCH_WRITE_CONCURRENCY)
+    async def write(query, make_update):
+        async with semaphore:
+            now = datetime.utcnow()
+            (seq,) = await next_change_seqs()
+            return await storage.submissions.update(query, stamped(make_update(now), seq, now), projection), now
+    return await asyncio.gather(*[write(query, make_update) for query, make_update in operations], return_exceptions=True)
+
+def record_batch_errors(results: list, errors: dict, op_indexes: list):
+    # errors are keyed by operation; op_indexes[i] is the position in results of operation i
+    for index, error in errors.items():
+        result = results[op_indexes[index]]
+        result["ok"] = False
+        result["error"] = error["message"]
+    return results
+
+# Create many submissions at once (students only)
+@app.post("/submissions/bulk", tags=["Create and Read Submissions"])
+async def create_submissions_bulk(submissions: List[Submission], principal: Principal = Depends(get_current_principal)):
+    if principal.role != "student":
+        raise HTTPException(status_code=403, detail="Only students can create submissions")
+    check_batch_size(submissions)
+    results, op_indexes, documents = [], [], []
+    for index, submission in enumerate(submissions):
+        try:
+            submission_dict = new_submission_document(submission, principal.username)
+        except HTTPException as e:
+            results.append({"index": index, "id": None, "ok": False, "error": e.detail})
+            continue
+        # Assign ids up front so every result can report its id
+        submission_dict["_id"] = ObjectId()
+        results.append({"index": index, "id": str(submission_dict["_id"]), "ok": True})
+        op_indexes.append(index)
+        documents.append(submission_dict)
+    if documents:
+        for doc, seq in zip(documents, await next_change_seqs(len(documents))):
+            doc.update(change_stamp(seq, doc["created_at"]))
+    record_batch_errors(results, await storage.submissions.create_many(documents), op_indexes)
+    created = [doc for doc, index in zip(documents, op_indexes) if results[index]["ok"]]
+    await update_rollups(db, [(None, doc) for doc in created])
+    for doc in created:
+        broker.emit("create", doc["_id"], principal.username, "pending")
+    await audit_log.record(*[
+        make_audit_event("create", doc["_id"], principal.username, principal.username, diff(None, doc, AUDITED_FIELDS), 1)
+        for doc in created
+    ])
+    return results
+
+# Update the status of many submissions at once (admins only)
+@app.put("/submissions/status:batch", tags=["Update Submissions"])
+async def update_status_batch(items: List[StatusBatchItem], principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can update status")
+    check_batch_size(items)
+    oids = [parse_object_id(item.id) for item in items]
+    existing = await storage.submissions.by_ids([oid for oid in oids if oid is not None], {"status": 1})
+    results, operations, op_indexes = [], [], []
+    for index, (item, oid) in enumerate(zip(items, oids)):
+        result = {"index": index, "id": item.id, "ok": False}
+        if oid is None:
+            result["error"] = "Invalid submission ID"
+        elif item.status not in ["approved", "revision"]:
+            result["error"] = "Invalid status"
+        elif oid not in existing:
+            result["error"] = "Submission not found"
+        else:
+            result["ok"] = True
+            # Only if the status is still the one read, so the rollup delta is exact
+            query = {"_id": oid, "status": existing[oid].get("status")}
+            update = {"$set": {"status": item.status}, "$inc": {"version": 1}}
+            operations.append((query, lambda now, update=update: update))
+            op_indexes.append(index)
+        results.append(result)
+    # One conditional write per item rather than a bulk write: each returns
+    # the document as it was before, like the single status update, and a
+    # concurrent change fails only its own item
+    updated = []
+    for index, outcome in zip(op_indexes, await write_each(operations, WRITE_PROJECTION)):
+        if isinstance(outcome, Exception):
+            results[index].update(ok=False, error=str(outcome))
+        elif outcome[0] is None:
+            results[index].update(ok=False, error="Submission changed or was deleted, retry")
+        else:
+            updated.append((index, outcome[0]))
+    await update_rollups(db, [(before, {**before, "status": items[index].status}) for index, before in updated])
+    for index, before in updated:
+        broker.emit("status", oids[index], before.get("student_id"), items[index].status)
+    await audit_log.record(*[
+        make_audit_event(
+            "status", oids[index], before.get("student_id"), principal.username,
+            diff(before, {"status": items[index].status}, ["status"]), before.get("version", 0) + 1
+        )
+        for index, before in updated
+    ])
+    return results
+
+# Add comments to many submissions at once (admins only)
+@app.post("/submissions/comments:batch", tags=["Add Comment"])
+async def add_comments_batch(items: List[CommentBatchItem], principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can add comments")
+    check_batch_size(items)
+    oids = [parse_object_id(item.id) for item in items]
+    results, operations, op_indexes = [], [], []
+    for index, (item, oid) in enumerate(zip(items, oids)):
+        result = {"index": index, "id": item.id, "ok": False}
+        if oid is None:
+            result["error"] = "Invalid submission ID"
+        else:
+            result["ok"] = True
+            operations.append(({"_id": oid}, lambda now: comment_counter_update(1, now)))
+            op_indexes.append(index)
+        results.append(result)
+    # The counter update is the existence check: a submission deleted
+    # meanwhile fails its item and gets no comment
+    commented = []
+    for index, outcome in zip(op_indexes, await write_each(operations, {"student_id": 1})):
+        if isinstance(outcome, Exception):
+            results[index].update(ok=False, error=str(outcome))
+        elif outcome[0] is None:
+            results[index].update(ok=False, error="Submission not found")
+        else:
+            commented.append((index, outcome[0].get("student_id"), outcome[1]))
+    comments = [
+        new_comment_document(oids[index], principal.username, items[index].comment, now)
+        for index, _, now in commented
+    ]
+    if comments:
+        record_batch_errors(results, await storage.comments.add_many(comments), [index for index, _, _ in commented])
+    added = [(comment, student_id) for comment, (index, student_id, _) in zip(comments, commented) if results[index]["ok"]]
+    for comment, student_id in added:
+        broker.emit("comment", comment["submission_id"], student_id)
+    await audit_log.record(*[
+        make_audit_event(
+            "comment", comment["submission_id"], student_id,
+            principal.username, {"comment": {"from": None, "to": comment["comment"]}}
+        )
+        for comment, student_id in added
+    ])
+    return results
+
+# Server-Sent Events stream of submission changes. Admins receive every event,
+# students only events for their own submissions.
+EVENT_KEEPALIVE_SECONDS = 15
+
+@app.get("/submissions/events", tags=["Create and Read Submissions"])
+async def submission_events(principal: Principal = Depends(get_current_principal)):
+    async def stream():
+        queue = broker.subscribe()
+        event_id = 0
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENT_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if principal.role != "admin" and event["student_id"] != principal.username:
+                    continue
+                event_id += 1
+                yield f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            broker.unsubscribe(queue)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# A conditional write matched nothing: tell "not found" from "changed since read".
+# Only runs on the failure path, successful writes are a single round-trip.
+async def raise_write_failure(query: dict, expected: Optional[int], not_found: str):
+    if expected is not None and await storage.submissions.get(query, {"_id": 1}):
+        raise HTTPException(status_code=412, detail="Submission was modified, reload and retry")
+    raise HTTPException(status_code=404, detail=not_found)
+
+# Get one submission with its ETag (admins, or the student who owns it)
+@app.get("/submissions/{submission_id}", tags=["Create and Read Submissions"], response_model=SubmissionOut)
+async def get_submission(submission_id: str, principal: Principal = Depends(get_current_principal)):
+    oid = parse_object_id(submission_id)
+    if oid is None:
+        raise HTTPException(status_code=400, detail="Invalid submission ID")
+    query = {"_id": oid}
+    if principal.role != "admin":
+        query["student_id"] = principal.username
+    submission = await storage.submissions.get(query)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found or not owned by user")
+    return BSONResponse(submission, headers={"ETag": etag(submission.get("version", 0))})
 
 # Update submission details (students only, their own)
+# Ownership (and the If-Match version, when sent) is part of the update filter.
 @app.put("/submissions/{submission_id}", tags=["Update Submissions"])
 async def update_submission(
     submission_id: str,
     submission: Submission,
-    current_user: str = Depends(get_current_user)
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    principal: Principal = Depends(get_current_principal)
 ):
-    role = await get_user_role(current_user)
-    if role != "student":
+    if principal.role != "student":
         raise HTTPException(status_code=403, detail="Only students can update submissions")
 
     try:
@@ -109,50 +698,191 @@ async def update_submission(
     except:
         raise HTTPException(status_code=400, detail="Invalid submission ID")
 
-    db_submission = await db.submissions.find_one(
-        {"_id": oid, "student_id": current_user}
-    )
-    if not db_submission:
-        raise HTTPException(status_code=404, detail="Submission not found or not owned by user")
-
-    await db.submissions.update_one(
-        {"_id": oid},
-        {"$set": {
-            "title": submission.title,
-            "content": submission.content,
-            "project_head": submission.project_head,
-            "budget": submission.budget,
-            "venue": submission.venue,
-            "organization_name": submission.organization_name,
-            "event_datetime": f"{submission.event_date} {submission.event_time}"
-        }}
-    )
+    expected = parse_if_match(if_match)
+    owner_filter = {"_id": oid, "student_id": principal.username}
+    query = {**owner_filter, **version_filter(expected)} if expected is not None else owner_filter
+    fields = submission_fields(submission)
+    (seq,) = await next_change_seqs()
+    update = stamped({"$set": fields, "$inc": {"version": 1}}, seq, datetime.utcnow())
+    before = await storage.submissions.update(query, update, EDIT_PROJECTION)
+    if not before:
+        await raise_write_failure(owner_filter, expected, "Submission not found or not owned by user")
+    await update_rollups(db, [(before, {**before, **fields})])
+    broker.emit("update", oid, principal.username, before.get("status"))
+    await audit_log.record(make_audit_event(
+        "update", oid, principal.username, principal.username,
+        diff(before, fields, list(fields)), before.get("version", 0) + 1
+    ))
 
+    response.headers["ETag"] = etag(before.get("version", 0) + 1)
     return {"message": "Submission updated"}
 
 # Add comment to submission (admins only)
 @app.post("/submissions/{submission_id}/comment", tags=["Add Comment"])
-async def add_comment(submission_id: str, comment: Comment, current_user: str = Depends(get_current_user)):
-    role = await get_user_role(current_user)
-    if role != "admin":
+async def add_comment(submission_id: str, comment: Comment, principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can add comments")
     try:
         oid = ObjectId(submission_id)
     except:
         raise HTTPException(status_code=400, detail="Invalid submission ID")
-    comment_dict = {
-        "admin_id": current_user,
-        "comment": comment.comment,
-        "timestamp": datetime.utcnow()
-    }
-    await db.submissions.update_one({"_id": oid}, {"$push": {"comments": comment_dict}})
+    now = datetime.utcnow()
+    (seq,) = await next_change_seqs()
+    db_submission = await storage.submissions.update(
+        {"_id": oid}, stamped(comment_counter_update(1, now), seq, now), projection={"student_id": 1}
+    )
+    if not db_submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    await storage.comments.add(new_comment_document(oid, principal.username, comment.comment, now))
+    broker.emit("comment", oid, db_submission.get("student_id"))
+    await audit_log.record(make_audit_event(
+        "comment", oid, db_submission.get("student_id"), principal.username,
+        {"comment": {"from": None, "to": comment.comment}}
+    ))
     return {"message": "Comment added"}
 
+# Get comments of a submission, oldest first (admins, or the student who owns it)
+# Paged like GET /submissions: the next cursor is in the X-Next-Cursor header.
+@app.get("/submissions/{submission_id}/comments", tags=["Add Comment"], response_model=List[CommentOut])
+async def get_comments(
+    submission_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    principal: Principal = Depends(get_current_principal)
+):
+    oid = parse_object_id(submission_id)
+    if oid is None:
+        raise HTTPException(status_code=400, detail="Invalid submission ID")
+    owner_filter = {"_id": oid}
+    if principal.role != "admin":
+        owner_filter["student_id"] = principal.username
+    if not await storage.submissions.get(owner_filter, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Submission not found or not owned by user")
+    query = {"submission_id": oid}
+    if after:
+        query = {"$and": [query, after_cursor_filter(after, "timestamp")]}
+    comments = await storage.comments.list(query, limit)
+    headers = {}
+    if len(comments) == limit:
+        last = comments[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last["timestamp"], last["_id"])
+    return BSONResponse(comments, headers=headers)
+
+# Audit history of a submission, oldest first (admins, or the student who owns
+# it). Still available after the submission is deleted. Events are written in
+# the background, so the latest change can take a moment to appear.
+@app.get("/submissions/{submission_id}/history", tags=["Create and Read Submissions"], response_model=List[SubmissionEventOut])
+async def get_submission_history(
+    submission_id: str,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    principal: Principal = Depends(get_current_principal)
+):
+    oid = parse_object_id(submission_id)
+    if oid is None:
+        raise HTTPException(status_code=400, detail="Invalid submission ID")
+    query = {"submission_id": oid}
+    if principal.role != "admin":
+        query["student_id"] = principal.username
+    if after:
+        query = {"$and": [query, after_cursor_filter(after, "timestamp")]}
+    events = await storage.submission_events.list(query, limit)
+    headers = {}
+    if len(events) == limit:
+        last = events[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last["timestamp"], last["_id"])
+    return BSONResponse(events, headers=headers)
+
+# Attachments (MongoDB only, files in GridFS). The owning student uploads
+# multipart/form-data with one file part; the file is streamed into GridFS and
+# its metadata added to the submission's "attachments" list, which is what
+# listings show. Downloads support Range requests (admins, or the owner).
+@app.post("/submissions/{submission_id}/attachments", tags=["Attachments"], response_model=AttachmentOut)
+async def upload_attachment(submission_id: str, request: Request, principal: Principal = Depends(get_current_principal)):
+    if principal.role != "student":
+        raise HTTPException(status_code=403, detail="Only students can upload attachments")
+    require_mongo("Attachments")
+    oid = parse_object_id(submission_id)
+    if oid is None:
+        raise HTTPException(status_code=400, detail="Invalid submission ID")
+    owner_filter = {"_id": oid, "student_id": principal.username}
+    # Checked before the upload so a rejected file is never read
+    submission = await storage.submissions.get(owner_filter, {"attachments._id": 1})
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found or not owned by user")
+    if len(submission.get("attachments", [])) >= MAX_ATTACHMENTS:
+        raise HTTPException(status_code=400, detail=f"A submission can have at most {MAX_ATTACHMENTS} attachments")
+
+    attachment = await receive_attachment(request, {"submission_id": oid, "uploaded_by": principal.username})
+    (seq,) = await next_change_seqs()
+    update = stamped({"$push": {"attachments": attachment}, "$inc": {"version": 1}}, seq, attachment["uploaded_at"])
+    # The limit again, for uploads that ran in parallel
+    query = {**owner_filter, f"attachments.{MAX_ATTACHMENTS - 1}": {"$exists": False}}
+    before = await storage.submissions.update(query, update, WRITE_PROJECTION)
+    if not before:
+        await delete_attachment_file(attachment["_id"])
+        raise HTTPException(status_code=409, detail="Submission was deleted or has too many attachments")
+    broker.emit("update", oid, principal.username, before.get("status"))
+    await audit_log.record(make_audit_event(
+        "attach", oid, principal.username, principal.username,
+        {"attachments": {"from": None, "to": attachment["filename"]}}, before.get("version", 0) + 1
+    ))
+    return BSONResponse(attachment, headers={"ETag": etag(before.get("version", 0) + 1)})
+
+@app.get("/submissions/{submission_id}/attachments/{attachment_id}", tags=["Attachments"])
+async def download_attachment(
+    submission_id: str,
+    attachment_id: str,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    principal: Principal = Depends(get_current_principal)
+):
+    require_mongo("Attachments")
+    oid, file_id = parse_object_id(submission_id), parse_object_id(attachment_id)
+    if oid is None or file_id is None:
+        raise HTTPException(status_code=400, detail="Invalid ID")
+    query = {"_id": oid, "attachments._id": file_id}
+    if principal.role != "admin":
+        query["student_id"] = principal.username
+    if not await storage.submissions.get(query, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    return await attachment_response(file_id, range, if_range, if_none_match)
+
+@app.delete("/submissions/{submission_id}/attachments/{attachment_id}", tags=["Attachments"])
+async def delete_attachment(submission_id: str, attachment_id: str, principal: Principal = Depends(get_current_principal)):
+    if principal.role != "student":
+        raise HTTPException(status_code=403, detail="Only students can delete attachments")
+    require_mongo("Attachments")
+    oid, file_id = parse_object_id(submission_id), parse_object_id(attachment_id)
+    if oid is None or file_id is None:
+        raise HTTPException(status_code=400, detail="Invalid ID")
+    (seq,) = await next_change_seqs()
+    update = stamped({"$pull": {"attachments": {"_id": file_id}}, "$inc": {"version": 1}}, seq, datetime.utcnow())
+    before = await storage.submissions.update(
+        {"_id": oid, "student_id": principal.username, "attachments._id": file_id}, update,
+        {**WRITE_PROJECTION, "attachments": {"$elemMatch": {"_id": file_id}}}
+    )
+    if not before:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    await delete_attachment_file(file_id)
+    broker.emit("update", oid, principal.username, before.get("status"))
+    await audit_log.record(make_audit_event(
+        "detach", oid, principal.username, principal.username,
+        {"attachments": {"from": before["attachments"][0]["filename"], "to": None}}, before.get("version", 0) + 1
+    ))
+    return {"message": "Attachment deleted"}
+
 # Update submission status (admins only)
 @app.put("/submissions/{submission_id}/status", tags=["Update Submissions"])
-async def update_status(submission_id: str, status_update: StatusUpdate, current_user: str = Depends(get_current_user)):
-    role = await get_user_role(current_user)
-    if role != "admin":
+async def update_status(
+    submission_id: str,
+    status_update: StatusUpdate,
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    principal: Principal = Depends(get_current_principal)
+):
+    if principal.role != "admin":
         raise HTTPException(status_code=403, detail="Only admins can update status")
     if status_update.status not in ["approved", "revision"]:
         raise HTTPException(status_code=400, detail="Invalid status")
@@ -160,34 +890,140 @@ async def update_status(submission_id: str, status_update: StatusUpdate, current
         oid = ObjectId(submission_id)
     except:
         raise HTTPException(status_code=400, detail="Invalid submission ID")
-    await db.submissions.update_one({"_id": oid}, {"$set": {"status": status_update.status}})
+    expected = parse_if_match(if_match)
+    query = {"_id": oid, **version_filter(expected)} if expected is not None else {"_id": oid}
+    (seq,) = await next_change_seqs()
+    update = stamped({"$set": {"status": status_update.status}, "$inc": {"version": 1}}, seq, datetime.utcnow())
+    before = await storage.submissions.update(query, update, WRITE_PROJECTION)
+    if not before:
+        await raise_write_failure({"_id": oid}, expected, "Submission not found")
+    await update_rollups(db, [(before, {**before, "status": status_update.status})])
+    broker.emit("status", oid, before.get("student_id"), status_update.status)
+    await audit_log.record(make_audit_event(
+        "status", oid, before.get("student_id"), principal.username,
+        diff(before, {"status": status_update.status}, ["status"]), before.get("version", 0) + 1
+    ))
+    response.headers["ETag"] = etag(before.get("version", 0) + 1)
     return {"message": "Status updated"}
 
 # Delete submission (students only, their own)
 @app.delete("/submissions/{submission_id}", tags=["Delete"])
-async def delete_submission(submission_id: str, current_user: str = Depends(get_current_user)):
-    role = await get_user_role(current_user)
-    if role != "student":
+async def delete_submission(
+    submission_id: str,
+    if_match: Optional[str] = Header(None),
+    principal: Principal = Depends(get_current_principal)
+):
+    if principal.role != "student":
         raise HTTPException(status_code=403, detail="Only students can delete submissions")
     try:
         oid = ObjectId(submission_id)
     except:
         raise HTTPException(status_code=400, detail="Invalid submission ID")
-    db_submission = await db.submissions.find_one({"_id": oid, "student_id": current_user})
+    expected = parse_if_match(if_match)
+    owner_filter = {"_id": oid, "student_id": principal.username}
+    query = {**owner_filter, **version_filter(expected)} if expected is not None else owner_filter
+    db_submission = await storage.submissions.delete(query, WRITE_PROJECTION)
     if not db_submission:
-        raise HTTPException(status_code=404, detail="Submission not found or not owned by user")
-    await db.submissions.delete_one({"_id": oid})
+        await raise_write_failure(owner_filter, expected, "Submission not found or not owned by user")
+    await storage.comments.delete_for_submission(oid)
+    if storage.is_mongo():
+        await delete_submission_attachments(oid)
+    (seq,) = await next_change_seqs()
+    await storage.submission_tombstones.add(new_tombstone_document(oid, principal.username, seq, datetime.utcnow()))
+    await update_rollups(db, [(db_submission, None)])
+    broker.emit("delete", oid, principal.username, db_submission.get("status"))
+    await audit_log.record(make_audit_event("delete", oid, principal.username, principal.username))
     return {"message": "Submission deleted"}
 
 # Get current user info
-@app.get("/me", tags=["Authentication & Users"])
-async def get_me(current_user: str = Depends(get_current_user)):
-    role = await get_user_role(current_user)
-    return {"username": current_user, "role": role}
+@app.get("/me", tags=["Authentication & Users"], response_model=UserOut)
+async def get_me(response: Response, if_none_match: Optional[str] = Header(None), principal: Principal = Depends(get_current_principal)):
+    tag = list_etag(f"{principal.username}|{principal.role}", [])
+    if etag_matches(if_none_match, tag):
+        return Response(status_code=304, headers={"ETag": tag})
+    response.headers["ETag"] = tag
+    return {"username": principal.username, "role": principal.role}
+
+# Change a user's role (admins only)
+@app.put("/users/{username}/role", tags=["Authentication & Users"])
+async def update_user_role(username: str, role_update: RoleUpdate, principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can change roles")
+    if role_update.role not in ["student", "admin"]:
+        raise HTTPException(status_code=400, detail="Invalid role")
+    if not await set_user_role(username, role_update.role):
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"message": "Role updated"}
+
+# Query plans for every query shape the API issues, flags collection scans (admins only)
+@app.get("/admin/query-plans", tags=["Admin"])
+async def get_query_plans(principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view query plans")
+    require_mongo("Query plans")
+    return await explain_queries(db)
+
+# Dashboard statistics (admins only)
+@app.get("/stats", tags=["Statistics"])
+async def get_dashboard_stats(principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view statistics")
+    require_mongo("Statistics")
+    return await get_stats(db)
+
+# Recompute the statistics rollups from all submissions (admins only)
+@app.post("/stats/rebuild", tags=["Statistics"])
+async def rebuild_dashboard_stats(principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can rebuild statistics")
+    require_mongo("Statistics")
+    await rebuild_rollups(db)
+    return {"message": "Statistics rebuilt"}
+
+# Password hashing pool utilization (admins only)
+@app.get("/admin/hash-pool", tags=["Admin"])
+async def get_hash_pool_stats(principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view hash pool stats")
+    return hash_pool.stats()
+
+# Background jobs and their last run in this worker (admins only)
+@app.get("/admin/jobs", tags=["Admin"])
+async def get_jobs(principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view background jobs")
+    return {"enabled": SCHEDULER_ENABLED, "owner": scheduler.owner, "jobs": scheduler.status()}
+
+# MongoDB connection pool utilization (admins only)
+@app.get("/admin/db-pool", tags=["Admin"])
+async def get_db_pool_stats(principal: Principal = Depends(get_current_principal)):
+    if principal.role != "admin":
+        raise HTTPException(status_code=403, detail="Only admins can view pool stats")
+    require_mongo("Pool stats")
+    return {"settings": database.pool_settings(), "pools": database.pool_stats.snapshot()}
+
+# Readiness: the storage answers a ping (through the pool on MongoDB)
+@app.get("/ready", tags=["Health"])
+async def ready(response: Response):
+    try:
+        await storage.get_store().ping()
+    except Exception as e:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "unavailable", "detail": str(e)}
+    return {"status": "ready"}
+
+# Metrics in Prometheus text exposition format
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def get_metrics():
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
 # Serve static files (for frontend)
-app.mount("/", StaticFiles(directory=".", html=True), name="static")
+# Static assets from their own directory, never the source tree
+STATIC_DIR = os.getenv("STATIC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+app.mount("/", CachedStaticFiles(directory=STATIC_DIR, html=True), name="static")
 
-# When the application is run directly, use uvicorn.
+# When the application is run directly, use uvicorn (development mode, one
+# process with reload; see server.py for production)
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8888, reload=True)
\ No newline at end of file
@@ -0,0 +1,192 @@
+# Minimal Prometheus-style metrics (counters, gauges, histograms) rendered in
+# the text exposition format. Label values are passed positionally in the order
+# of labelnames. Updates take one lock and a dict lookup, so they are cheap
+# enough for the request path and safe from pymongo's monitoring threads.
+import bisect
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, labels, value) for labels, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value, *extra in self.samples():
+            lines.append(f"{name}{_format_labels(self.labelnames, labels, *extra)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        with self._lock:
+            self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, *labels, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # per-bucket counts (last slot is +Inf), sum
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            values = [(labels, list(entry[0]), entry[1]) for labels, entry in self._values.items()]
+        samples = []
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", labels, cumulative, f'le="{bound}"'))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(*self.labels, value=time.perf_counter() - self.start)
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def add_collector(self, collector):
+        # Called before each render, e.g. to copy pool stats into gauges
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Metrics recorded by the application
+http_requests_total = Counter("http_requests_total", "HTTP requests handled.", ["method", "route", "status"])
+http_request_duration_seconds = Histogram("http_request_duration_seconds", "HTTP request latency.", ["method", "route"])
+http_requests_in_flight = Gauge("http_requests_in_flight", "HTTP requests currently being handled.")
+mongodb_command_duration_seconds = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency.", ["collection", "command"]
+)
+mongodb_command_failures_total = Counter("mongodb_command_failures_total", "Failed MongoDB commands.", ["collection", "command"])
+password_hash_duration_seconds = Histogram(
+    "password_hash_duration_seconds", "Time spent in bcrypt, excluding queueing.", ["operation"],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.5)
+)
+audit_events_written_total = Counter("audit_events_written_total", "Audit events written to submission_events.")
+audit_events_failed_total = Counter("audit_events_failed_total", "Audit events that could not be written.")
+rate_limited_total = Counter("rate_limited_total", "Requests rejected with 429 by the rate limiter.", ["limit"])
+scheduler_job_runs_total = Counter(
+    "scheduler_job_runs_total", "Background job runs by outcome (ok, error, skipped when another worker holds the lease).",
+    ["job", "outcome"]
+)
+scheduler_job_duration_seconds = Histogram(
+    "scheduler_job_duration_seconds", "Background job run time.", ["job"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+)
+scheduler_job_items_total = Counter("scheduler_job_items_total", "Documents processed by background jobs.", ["job"])
+scheduler_job_last_success_seconds = Gauge(
+    "scheduler_job_last_success_seconds", "Unix time of the last successful run of a background job.", ["job"]
+)
+
+# ASGI middleware recording per-route latency, status codes and in-flight requests.
+# The route label is the path template (e.g. /submissions/{submission_id}) so the
+# number of series stays bounded.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration_seconds.observe(method, route, value=elapsed)
+            http_requests_total.inc(method, route, str(status_code))
@@ -0,0 +1,137 @@
+# Data migrations. Each one streams documents from a cursor in batches so it
+# runs in constant memory, and is safe to re-run after an interruption.
+#
+#   python migrations.py comments [--batch-size 500]
+#   python migrations.py event_datetime [--batch-size 500]
+#   python migrations.py sequence [--batch-size 500]
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, ReturnDocument
+from database import get_database
+from models import new_comment_document, comment_counter_update, change_stamp, DEFAULT_EVENT_DURATION_MINUTES
+
+# Move comments embedded in submissions into the comments collection
+async def migrate_comments(db, batch_size: int = 500):
+    migrated_submissions = 0
+    migrated_comments = 0
+    cursor = db.submissions.find({"comments": {"$exists": True}}, {"comments": 1}).batch_size(batch_size)
+    batch = []
+    async for submission in cursor:
+        batch.append(submission)
+        if len(batch) >= batch_size:
+            migrated_comments += await _migrate_comment_batch(db, batch)
+            migrated_submissions += len(batch)
+            print(f"comments: {migrated_submissions} submissions, {migrated_comments} comments migrated")
+            batch = []
+    if batch:
+        migrated_comments += await _migrate_comment_batch(db, batch)
+        migrated_submissions += len(batch)
+    print(f"comments: done, {migrated_submissions} submissions, {migrated_comments} comments migrated")
+
+async def _migrate_comment_batch(db, submissions):
+    ids = [submission["_id"] for submission in submissions]
+    # Remove copies left by an interrupted earlier run of this batch
+    await db.comments.delete_many({"submission_id": {"$in": ids}, "migrated": True})
+    comments, updates = [], []
+    for submission in submissions:
+        embedded = submission.get("comments") or []
+        for comment in embedded:
+            document = new_comment_document(
+                submission["_id"], comment.get("admin_id"), comment.get("comment"), comment.get("timestamp")
+            )
+            document["migrated"] = True
+            comments.append(document)
+        # $inc/$max keep counts right for comments added through the API during the migration
+        last_comment_at = max((c["timestamp"] for c in embedded if c.get("timestamp")), default=None)
+        if last_comment_at:
+            update = comment_counter_update(len(embedded), last_comment_at)
+        else:
+            update = {"$inc": {"comment_count": len(embedded)}}
+        update["$unset"] = {"comments": ""}
+        updates.append(UpdateOne({"_id": submission["_id"]}, update))
+    if comments:
+        await db.comments.insert_many(comments, ordered=False)
+    await db.submissions.bulk_write(updates, ordered=False)
+    return len(comments)
+
+# Convert "YYYY-MM-DD HH:MM:SS" event_datetime strings into datetimes and add
+# duration_minutes/event_end. Only string values match, so re-running continues
+# where it stopped; values that cannot be parsed are left as they are.
+async def migrate_event_datetime(db, batch_size: int = 500):
+    converted = 0
+    skipped = 0
+    cursor = db.submissions.find(
+        {"event_datetime": {"$type": "string"}}, {"event_datetime": 1, "duration_minutes": 1}
+    ).batch_size(batch_size)
+    updates = []
+    async for submission in cursor:
+        try:
+            event_datetime = datetime.fromisoformat(submission["event_datetime"])
+        except ValueError:
+            skipped += 1
+            continue
+        duration = submission.get("duration_minutes") or DEFAULT_EVENT_DURATION_MINUTES
+        updates.append(UpdateOne(
+            {"_id": submission["_id"], "event_datetime": submission["event_datetime"]},
+            {"$set": {
+                "event_datetime": event_datetime,
+                "duration_minutes": duration,
+                "event_end": event_datetime + timedelta(minutes=duration),
+            }}
+        ))
+        if len(updates) >= batch_size:
+            await db.submissions.bulk_write(updates, ordered=False)
+            converted += len(updates)
+            updates = []
+            print(f"event_datetime: {converted} converted")
+    if updates:
+        await db.submissions.bulk_write(updates, ordered=False)
+        converted += len(updates)
+    print(f"event_datetime: done, {converted} converted, {skipped} could not be parsed")
+
+# Give submissions written before change tracking a seq and updated_at so GET
+# /submissions/changes returns them. Values come from the counter the API uses;
+# only submissions without a seq match, so re-running continues where it stopped.
+async def migrate_sequence(db, batch_size: int = 500):
+    stamped = 0
+    cursor = db.submissions.find({"seq": None}, {"_id": 1}).batch_size(batch_size)
+    batch = []
+    async for submission in cursor:
+        batch.append(submission["_id"])
+        if len(batch) >= batch_size:
+            stamped += await _stamp_batch(db, batch)
+            print(f"sequence: {stamped} submissions stamped")
+            batch = []
+    if batch:
+        stamped += await _stamp_batch(db, batch)
+    print(f"sequence: done, {stamped} submissions stamped")
+
+async def _stamp_batch(db, ids):
+    counter = await db.counters.find_one_and_update(
+        {"_id": "submissions"}, {"$inc": {"value": len(ids)}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    first = counter["value"] - len(ids) + 1
+    now = datetime.utcnow()
+    result = await db.submissions.bulk_write([
+        UpdateOne({"_id": oid, "seq": None}, {"$set": change_stamp(first + i, now)})
+        for i, oid in enumerate(ids)
+    ], ordered=False)
+    return result.modified_count
+
+MIGRATIONS = {
+    "comments": migrate_comments,
+    "event_datetime": migrate_event_datetime,
+    "sequence": migrate_sequence,
+}
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("migration", choices=sorted(MIGRATIONS))
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+    await MIGRATIONS[args.migration](get_database(), args.batch_size)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,21 +1,78 @@
 from fastapi import HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
-from motor.motor_asyncio import AsyncIOMotorClient
-from passlib.context import CryptContext
+from pydantic import BaseModel, BeforeValidator, Field
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Annotated, List, Optional
+from bson import ObjectId
+import asyncio
+import base64
+import hashlib
+import os
+import time
 
-# MongoDB connection
-client = AsyncIOMotorClient("mongodb://localhost:27017")
-db = client["submission_system"]
+# Users are read through the storage layer (MongoDB by default, see storage.py)
+import storage
+from metrics import password_hash_duration_seconds
 
 # Security
 SECRET_KEY = "your-secret-key"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing: bcrypt runs in a worker pool so it never blocks the event loop.
+# Changing BCRYPT_ROUNDS makes existing hashes "deprecated"; they are rehashed on next login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread")  # "thread" or "process"
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "4"))
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY", str(HASH_WORKERS)))
+
+# Role cache: how long a worker can keep honouring a role changed through
+# another worker
+ROLE_CACHE_SIZE = 10000
+ROLE_CACHE_TTL_SECONDS = float(os.getenv("ROLE_CACHE_TTL_SECONDS", "60"))
+
+# Pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+# Events: end = start + duration; the maximum bounds the conflict range scan
+DEFAULT_EVENT_DURATION_MINUTES = 120
+MAX_EVENT_DURATION_MINUTES = 24 * 60
+
+# Maximum number of operations in one batch request
+MAX_BATCH_SIZE = 1000
+
+# Tombstones of deleted submissions are kept this long; GET /submissions/changes
+# answers older sync tokens with 410 and the client reloads everything
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+
+# Fields that can be requested through the "fields" projection of GET /submissions
+SUBMISSION_FIELDS = [
+    "student_id", "title", "content", "project_head", "budget", "venue",
+    "organization_name", "event_datetime", "duration_minutes", "event_end", "status",
+    "comment_count", "last_comment_at", "version", "created_at", "seq", "updated_at", "attachments",
+    "escalated_at", "reminder_sent_at"
+]
+# Fields returned by the "summary" view (no content)
+SUMMARY_FIELDS = [
+    "student_id", "title", "project_head", "budget", "venue",
+    "organization_name", "event_datetime", "event_end", "status", "comment_count", "created_at", "attachments"
+]
+
+# passlib and bcrypt are only needed by login and registration, so they are
+# imported on first use rather than when a worker starts
+_pwd_context = None
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _pwd_context
+
 security = HTTPBearer()
 
 # Data models using Pydantic
@@ -37,6 +94,7 @@ class Submission(BaseModel):
     organization_name: str
     event_date: str
     event_time: str
+    duration_minutes: Optional[int] = None
 
 class Comment(BaseModel):
     comment: str
@@ -44,12 +102,293 @@ class Comment(BaseModel):
 class StatusUpdate(BaseModel):
     status: str  # "approved" or "revision"
 
-# Helper functions for authentication and user management
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+class StatusBatchItem(BaseModel):
+    id: str
+    status: str  # "approved" or "revision"
+
+class CommentBatchItem(BaseModel):
+    id: str
+    comment: str
+
+class RoleUpdate(BaseModel):
+    role: str  # "student" or "admin"
+
+# Authenticated caller, resolved once per request
+class Principal(BaseModel):
+    username: str
+    role: Optional[str] = None
+
+# Response models. Listing endpoints return BSONResponse (see responses.py), so
+# these document the wire format in OpenAPI rather than validate every item.
+# Everything but _id is optional because of the fields/view projections.
+# Ids are ObjectIds in the documents and strings on the wire.
+ObjectIdStr = Annotated[str, BeforeValidator(lambda value: str(value) if isinstance(value, ObjectId) else value)]
+
+class AttachmentOut(BaseModel):
+    id: ObjectIdStr = Field(alias="_id")
+    filename: str
+    content_type: str
+    length: int
+    uploaded_at: datetime
+
+class SubmissionOut(BaseModel):
+    id: ObjectIdStr = Field(alias="_id")
+    student_id: Optional[str] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    project_head: Optional[str] = None
+    budget: Optional[int] = None
+    venue: Optional[str] = None
+    organization_name: Optional[str] = None
+    event_datetime: Optional[datetime] = None
+    duration_minutes: Optional[int] = None
+    event_end: Optional[datetime] = None
+    status: Optional[str] = None
+    comment_count: Optional[int] = None
+    last_comment_at: Optional[datetime] = None
+    version: Optional[int] = None
+    created_at: Optional[datetime] = None
+    seq: Optional[int] = None
+    updated_at: Optional[datetime] = None
+    attachments: Optional[List[AttachmentOut]] = None  # metadata only, see GET .../attachments/{id}
+    escalated_at: Optional[datetime] = None  # still pending after STALE_PENDING_DAYS
+    reminder_sent_at: Optional[datetime] = None  # event reminder published
+
+class SearchResultOut(SubmissionOut):
+    score: float
+
+class CommentOut(BaseModel):
+    id: ObjectIdStr = Field(alias="_id")
+    submission_id: ObjectIdStr
+    admin_id: str
+    comment: str
+    timestamp: datetime
+
+class UserOut(BaseModel):
+    username: str
+    role: Optional[str] = None
+
+class SubmissionEventOut(BaseModel):
+    id: ObjectIdStr = Field(alias="_id")
+    submission_id: ObjectIdStr
+    student_id: Optional[str] = None
+    type: str  # "create", "update", "status", "comment", "attach", "detach", "escalate", "reminder" or "delete"
+    actor: str
+    changes: dict  # {field: {"from": ..., "to": ...}}
+    version: Optional[int] = None
+    timestamp: datetime
+
+class SubmissionTombstoneOut(BaseModel):
+    id: ObjectIdStr = Field(alias="_id")
+    student_id: Optional[str] = None
+    seq: int
+    deleted_at: datetime
+
+class SubmissionChangesOut(BaseModel):
+    changed: List[SubmissionOut]
+    deleted: List[SubmissionTombstoneOut]
+    next: str  # pass as since on the next call
+    more: bool  # more changes are waiting, call again right away
+
+# Helper functions for submissions
+def parse_event_datetime(event_date: str, event_time: str):
+    try:
+        return datetime.fromisoformat(f"{event_date} {event_time}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid event date or time")
+
+def event_duration(duration_minutes: Optional[int]):
+    if duration_minutes is None:
+        return DEFAULT_EVENT_DURATION_MINUTES
+    if not 0 < duration_minutes <= MAX_EVENT_DURATION_MINUTES:
+        raise HTTPException(status_code=400, detail=f"Duration must be between 1 and {MAX_EVENT_DURATION_MINUTES} minutes")
+    return duration_minutes
+
+def parse_date(value: str):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be YYYY-MM-DD")
+
+def submission_fields(submission: Submission):
+    # Fields a student provides on create and update
+    event_datetime = parse_event_datetime(submission.event_date, submission.event_time)
+    duration = event_duration(submission.duration_minutes)
+    return {
+        "title": submission.title,
+        "content": submission.content,
+        "project_head": submission.project_head,
+        "budget": submission.budget,
+        "venue": submission.venue,
+        "organization_name": submission.organization_name,
+        "event_datetime": event_datetime,
+        "duration_minutes": duration,
+        "event_end": event_datetime + timedelta(minutes=duration)
+    }
+
+def new_submission_document(submission: Submission, student_id: str):
+    return {
+        "student_id": student_id,
+        **submission_fields(submission),
+        "status": "pending",
+        # last_comment_at is left out until the first comment: $max sets a
+        # missing field everywhere, while some engines (mongomock) cannot
+        # compare a date with null
+        "comment_count": 0,
+        "version": 1,
+        "created_at": datetime.utcnow()
+    }
+
+def new_comment_document(submission_id: ObjectId, admin_id: str, comment: str, timestamp: datetime):
+    return {
+        "submission_id": submission_id,
+        "admin_id": admin_id,
+        "comment": comment,
+        "timestamp": timestamp
+    }
+
+def new_tombstone_document(submission_id: ObjectId, student_id: str, seq: int, timestamp: datetime):
+    # Left behind by a deleted submission so synced clients can drop it
+    return {
+        "_id": submission_id,
+        "student_id": student_id,
+        "seq": seq,
+        "deleted_at": timestamp
+    }
+
+def comment_counter_update(count: int, timestamp: datetime):
+    # Denormalized comment stats kept on the submission
+    return {"$inc": {"comment_count": count}, "$max": {"last_comment_at": timestamp}}
+
+# Change tracking: every write stamps the submission with the next value of the
+# "submissions" sequence and the time; GET /submissions/changes pages by seq
+def change_stamp(seq: int, timestamp: datetime):
+    return {"seq": seq, "updated_at": timestamp}
 
+def stamped(update: dict, seq: int, timestamp: datetime):
+    # The update with the change stamp added to its $set
+    return {**update, "$set": {**update.get("$set", {}), **change_stamp(seq, timestamp)}}
+
+# Reserves count values of the submissions change sequence, in order
+async def next_change_seqs(count: int = 1):
+    last = await storage.counters.increment("submissions", count)
+    return list(range(last - count + 1, last + 1))
+
+# Optimistic concurrency: the submission version is exposed as the ETag and
+# checked against If-Match on writes
+def etag(version: int):
+    return f'"{version}"'
+
+def parse_if_match(value: Optional[str]):
+    # Returns the expected version, or None when the write is unconditional
+    if value is None or value.strip() == "*":
+        return None
+    value = value.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid If-Match header")
+
+# Validator for a list of submissions: changes whenever a listed submission is
+# edited (version), reviewed (version) or commented on (comment_count)
+LIST_VALIDATOR_PROJECTION = {"_id": 1, "created_at": 1, "version": 1, "comment_count": 1}
+
+def list_etag(key: str, submissions: list):
+    digest = hashlib.sha1(key.encode())
+    for sub in submissions:
+        digest.update(f"|{sub['_id']}:{sub.get('version', 0)}:{sub.get('comment_count', 0)}".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], tag: str):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    def opaque(value):
+        value = value.strip()
+        return value[2:] if value.startswith("W/") else value
+    return opaque(tag) in [opaque(value) for value in if_none_match.split(",")]
+
+def version_filter(expected: int):
+    # Submissions created before versioning have no version field, treat them as 0
+    return {"version": {"$in": [0, None]}} if expected == 0 else {"version": expected}
+
+def parse_object_id(value: str):
+    try:
+        return ObjectId(value)
+    except Exception:
+        return None
+
+# Helper functions for authentication and user management
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
+
+def verify_and_update_password(plain_password, hashed_password):
+    # Returns (valid, new_hash); new_hash is set when the stored hash uses outdated settings
+    return get_pwd_context().verify_and_update(plain_password, hashed_password)
+
+# Bounded pool for bcrypt work. The semaphore caps how many hashes run at once;
+# callers beyond that wait in the queue, which is tracked for monitoring.
+class HashPool:
+    def __init__(self, kind: str = HASH_EXECUTOR, workers: int = HASH_WORKERS, max_concurrency: int = HASH_MAX_CONCURRENCY):
+        self.kind = kind
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.in_flight = 0
+        self.waiting = 0
+        self._executor = None
+        self._semaphore = None
+
+    def _get_executor(self):
+        # Created lazily so forked uvicorn workers each get their own pool
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, func, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            with password_hash_duration_seconds.time(func.__name__):
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+hash_pool = HashPool()
+
+async def get_password_hash_async(password):
+    return await hash_pool.run(get_password_hash, password)
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    return await hash_pool.run(verify_and_update_password, plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
@@ -61,16 +400,122 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# Username of a valid token, None otherwise (used to key rate limits)
+def token_subject(token: str):
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+# Bounded in-process cache of username -> (role, version) with a TTL per entry
+class RoleCache:
+    def __init__(self, maxsize: int = ROLE_CACHE_SIZE, ttl: float = ROLE_CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, username: str):
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[username]
+            return None
+        self._entries.move_to_end(username)
+        return value
+
+    def set(self, username: str, role: str, version: int):
+        self._entries[username] = ((role, version), time.monotonic() + self.ttl)
+        self._entries.move_to_end(username)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, username: str):
+        self._entries.pop(username, None)
+
+role_cache = RoleCache()
+
+# (role, version) of the user, or None if there is no such user. A cached
+# entry older than min_version (a token issued after a change this worker has
+# not seen) is read again.
+async def get_user_role_version(username: str, min_version: int = 0):
+    cached = role_cache.get(username)
+    if cached is not None and cached[1] >= min_version:
+        return cached
+    user = await storage.users.get(username, {"role": 1, "version": 1})
+    if not user:
+        role_cache.invalidate(username)
+        return None
+    role_cache.set(username, user["role"], user.get("version", 0))
+    return user["role"], user.get("version", 0)
+
+# Change a user's role. The version bump revokes the tokens issued before it
+# (their "ver" claim is lower, see get_current_principal)
+async def set_user_role(username: str, role: str):
+    user = await storage.users.set_role(username, role)
+    if not user:
+        role_cache.invalidate(username)
+        return False
+    role_cache.set(username, user["role"], user["version"])
+    return True
+
+# Resolve the caller from the token. Tokens carry the user's version at
+# login ("ver"); the role and current version come from the user record
+# through the role cache (most requests skip the lookup). A token older than
+# the user's version was issued before a role change and gets 401, as do
+# tokens of deleted users. The worker that made the change updates its cache
+# right away; other workers notice when their entry expires, so a changed
+# role can be honoured there for up to ROLE_CACHE_TTL_SECONDS.
+async def get_current_principal(credentials: HTTPAuthorizationCredentials = Depends(security)):
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return username
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid token")
+    username = payload.get("sub")
+    if username is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    version = payload.get("ver", 0)
+    stored = await get_user_role_version(username, version)
+    if stored is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    role, stored_version = stored
+    if version < stored_version:
+        raise HTTPException(status_code=401, detail="Token revoked, log in again")
+    return Principal(username=username, role=role)
 
-async def get_user_role(username: str):
-    user = await db.users.find_one({"username": username})
-    return user["role"] if user else None
\ No newline at end of file
+# Helper functions for cursor pagination
+def encode_cursor(value: datetime, oid: ObjectId):
+    raw = f"{value.isoformat()}|{oid}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        created_at, oid = raw.split("|")
+        return datetime.fromisoformat(created_at), ObjectId(oid)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def after_cursor_filter(cursor: str, field: str = "created_at"):
+    # Keyset condition on (field, _id) so each page is an index range scan
+    value, oid = decode_cursor(cursor)
+    return {"$or": [
+        {field: {"$gt": value}},
+        {field: value, "_id": {"$gt": oid}}
+    ]}
+
+# Sync tokens for GET /submissions/changes: the last sequence value the client
+# has, and a time before which it has seen every change (to detect tokens older
+# than the tombstones)
+def encode_change_token(seq: int, complete_at: datetime):
+    raw = f"{seq}|{complete_at.isoformat()}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_change_token(token: str):
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+        seq, complete_at = raw.split("|")
+        return int(seq), datetime.fromisoformat(complete_at)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid sync token")
@@ -0,0 +1,159 @@
+# Rate limiting with token buckets.
+#
+# A RateLimit allows `rate` requests per second on average with bursts of up to
+# `burst`. Buckets live in a backend; InMemoryBackend keeps them in this
+# process (per uvicorn worker). A shared backend (e.g. Redis) only has to
+# implement RateLimitBackend.acquire to make the limits global.
+#
+# The default limit applies per authenticated user and per client IP only for
+# anonymous requests: the Streamlit frontend calls the API from its server,
+# so all of its users share one address. Per-IP buckets (the default one and
+# those of login and register) are skipped for RATE_LIMIT_EXEMPT_IPS, e.g. the
+# frontend's address; the per-username login limit still applies.
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from metrics import rate_limited_total
+
+class RateLimit:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def parse(cls, value: str):
+        # "count/seconds", e.g. "5/60" = 5 requests per minute, bursts of 5
+        count, seconds = value.split("/")
+        return cls(int(count) / float(seconds), int(count))
+
+def limit_from_env(name: str, default: str):
+    return RateLimit.parse(os.getenv(name, default))
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") == "1"
+TRUST_PROXY_HEADERS = os.getenv("TRUST_PROXY_HEADERS", "0") == "1"
+DEFAULT_LIMIT = limit_from_env("RATE_LIMIT_DEFAULT", "40/2")
+LOGIN_IP_LIMIT = limit_from_env("RATE_LIMIT_LOGIN_IP", "20/60")
+LOGIN_USER_LIMIT = limit_from_env("RATE_LIMIT_LOGIN_USER", "5/60")
+REGISTER_IP_LIMIT = limit_from_env("RATE_LIMIT_REGISTER_IP", "5/60")
+RATE_LIMIT_EXEMPT_IPS = {ip.strip() for ip in os.getenv("RATE_LIMIT_EXEMPT_IPS", "").split(",") if ip.strip()}
+
+class RateLimitBackend:
+    # Take one token from the bucket `key`. Returns 0 when allowed, otherwise
+    # the number of seconds until a token is available.
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        raise NotImplementedError
+
+class InMemoryBackend(RateLimitBackend):
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def try_acquire(self, key: str, limit: RateLimit, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [float(limit.burst), now]
+            if len(self._buckets) > self.max_keys:
+                # Least recently used buckets go first; they have refilled anyway
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / limit.rate
+
+    async def acquire(self, key: str, limit: RateLimit) -> float:
+        return self.try_acquire(key, limit)
+
+class RateLimiter:
+    def __init__(self, backend: RateLimitBackend = None, enabled: bool = RATE_LIMIT_ENABLED):
+        self.backend = backend or InMemoryBackend()
+        self.enabled = enabled
+
+    async def check(self, name: str, key: str, limit: RateLimit):
+        # Raises 429 with Retry-After when the bucket `name:key` is empty
+        if not self.enabled:
+            return
+        retry_after = await self.backend.acquire(f"{name}:{key}", limit)
+        if retry_after:
+            rate_limited_total.inc(name)
+            raise HTTPException(
+                status_code=429, detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+
+limiter = RateLimiter()
+
+def client_ip(scope) -> str:
+    if TRUST_PROXY_HEADERS:
+        for name, value in scope.get("headers", []):
+            if name == b"x-forwarded-for":
+                return value.decode().split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+def bearer_token(scope):
+    for name, value in scope.get("headers", []):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+    return None
+
+# Dependency: per-IP limit for one route, e.g. Depends(limit_ip("login", LOGIN_IP_LIMIT))
+def limit_ip(name: str, limit: RateLimit):
+    async def dependency(request: Request):
+        ip = client_ip(request.scope)
+        if ip not in RATE_LIMIT_EXEMPT_IPS:
+            await limiter.check(name, f"ip:{ip}", limit)
+    return dependency
+
+# ASGI middleware applying DEFAULT_LIMIT to every HTTP request. token_subject
+# maps a bearer token to its user (None if invalid); without it, or for
+# requests without a valid token, the bucket is per client IP.
+class RateLimitMiddleware:
+    def __init__(self, app, limit: RateLimit = DEFAULT_LIMIT, exempt_paths=("/metrics", "/ready"), token_subject=None):
+        self.app = app
+        self.limit = limit
+        self.exempt_paths = set(exempt_paths)
+        self.token_subject = token_subject
+
+    # Bucket of the request, None if it is not limited
+    def key(self, scope):
+        if self.token_subject is not None:
+            token = bearer_token(scope)
+            subject = self.token_subject(token) if token else None
+            if subject:
+                return f"default:user:{subject}"
+        ip = client_ip(scope)
+        return None if ip in RATE_LIMIT_EXEMPT_IPS else f"default:ip:{ip}"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not limiter.enabled or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        key = self.key(scope)
+        if key is None:
+            await self.app(scope, receive, send)
+            return
+        retry_after = await limiter.backend.acquire(key, self.limit)
+        if not retry_after:
+            await self.app(scope, receive, send)
+            return
+        rate_limited_total.inc("default")
+        body = json.dumps({"detail": "Too many requests"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(math.ceil(retry_after)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
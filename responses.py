@@ -0,0 +1,39 @@
+# Response classes: JSON built straight from MongoDB documents, and static
+# files with caching headers.
+#
+# Returning a BSONResponse from an endpoint skips FastAPI's jsonable_encoder
+# and response model validation: orjson serializes datetimes natively (same
+# ISO 8601 text as datetime.isoformat()) and ObjectIds go through
+# bson_default, so documents from the driver are written as they are.
+# The response_model on the route still documents the shape in OpenAPI.
+import os
+import orjson
+from bson import ObjectId
+from fastapi.responses import ORJSONResponse
+from fastapi.staticfiles import StaticFiles
+
+def bson_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def bson_dumps(content) -> bytes:
+    return orjson.dumps(content, default=bson_default, option=orjson.OPT_NON_STR_KEYS)
+
+class BSONResponse(ORJSONResponse):
+    def render(self, content) -> bytes:
+        return bson_dumps(content)
+
+# Static files with Cache-Control. StaticFiles already sends ETag and
+# Last-Modified and answers conditional requests with 304; HTML is revalidated
+# on every load, other assets are cached for STATIC_MAX_AGE seconds.
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", "3600"))
+
+class CachedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if str(full_path).endswith(".html"):
+            response.headers["Cache-Control"] = "no-cache"
+        else:
+            response.headers["Cache-Control"] = f"public, max-age={STATIC_MAX_AGE}"
+        return response
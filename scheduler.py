@@ -0,0 +1,196 @@
+# Background jobs.
+#
+# Every worker process runs a scheduler task per job:
+#   escalate_stale_pending - marks submissions still pending STALE_PENDING_DAYS
+#                            after creation with "escalated_at"
+#   event_reminders        - marks approved submissions whose event starts in
+#                            the next EVENT_REMINDER_HOURS with "reminder_sent_at"
+#   purge_expired          - deletes tombstones older than TOMBSTONE_RETENTION_DAYS
+#                            and, if AUDIT_RETENTION_DAYS is set, older audit events
+# Marked submissions get a change stamp, an audit event and an SSE event
+# ("escalate" or "reminder") like any other write. Jobs read through indexed
+# queries in batches of JOB_BATCH_SIZE, at most JOB_MAX_BATCHES per run, and
+# pause between batches so request handling is not starved.
+#
+# Before a run the worker takes the job's lease in the "leases" collection for
+# one interval and renews it after every batch. Other workers find the lease
+# held and skip the run, so a job runs about once per interval whatever the
+# number of workers; the holder keeps running it while it lives (it can take
+# its own lease again before expiry), and if it dies its lease expires and
+# another worker takes over. Intervals are jittered so workers started
+# together do not keep racing.
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+import storage
+from audit import audit_log, make_audit_event
+from events import broker
+from metrics import (
+    scheduler_job_runs_total, scheduler_job_duration_seconds, scheduler_job_items_total,
+    scheduler_job_last_success_seconds
+)
+from models import TOMBSTONE_RETENTION_DAYS, next_change_seqs, stamped
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1") != "0"
+STALE_PENDING_DAYS = int(os.getenv("STALE_PENDING_DAYS", "14"))
+EVENT_REMINDER_HOURS = int(os.getenv("EVENT_REMINDER_HOURS", "48"))
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "0"))  # 0 keeps the audit log forever
+JOB_BATCH_SIZE = 100
+JOB_MAX_BATCHES = 20
+JOB_BATCH_PAUSE_SECONDS = 0.05
+JOB_JITTER = 0.1
+SCHEDULER_ACTOR = "scheduler"
+
+# Sets field on the submissions that still match condition, with a change
+# stamp and a version bump, and records and publishes event_type for each.
+# Returns how many were updated.
+async def _mark_submissions(documents, condition: dict, field: str, event_type: str):
+    if not documents:
+        return 0
+    events = []
+    for document in documents:
+        # One reservation per write, right before it: the changes feed
+        # assumes a write lands shortly after its seq (CHANGES_SETTLE_SECONDS)
+        now = datetime.utcnow()
+        (seq,) = await next_change_seqs()
+        before = await storage.submissions.update(
+            {"_id": document["_id"], **condition},
+            stamped({"$set": {field: now}, "$inc": {"version": 1}}, seq, now),
+            {"student_id": 1, "status": 1, "version": 1}
+        )
+        if before is None:
+            # Changed since it was read
+            continue
+        broker.emit(event_type, document["_id"], before.get("student_id"), before.get("status"))
+        events.append(make_audit_event(
+            event_type, document["_id"], before.get("student_id"), SCHEDULER_ACTOR,
+            {field: {"from": None, "to": now}}, before.get("version", 1) + 1
+        ))
+    await audit_log.record(*events)
+    return len(events)
+
+# Each sweep handles one batch and returns (documents read, documents processed)
+
+async def escalate_stale_pending(batch_size: int):
+    cutoff = datetime.utcnow() - timedelta(days=STALE_PENDING_DAYS)
+    condition = {"status": "pending", "escalated_at": None}
+    documents = await storage.submissions.list(
+        {**condition, "created_at": {"$lt": cutoff}}, {"_id": 1},
+        sort=[("created_at", 1), ("_id", 1)], limit=batch_size
+    )
+    return len(documents), await _mark_submissions(documents, condition, "escalated_at", "escalate")
+
+async def remind_upcoming_events(batch_size: int):
+    now = datetime.utcnow()
+    condition = {"status": "approved", "reminder_sent_at": None}
+    documents = await storage.submissions.list(
+        {**condition, "event_datetime": {"$gte": now, "$lt": now + timedelta(hours=EVENT_REMINDER_HOURS)}},
+        {"_id": 1}, sort=[("event_datetime", 1), ("_id", 1)], limit=batch_size
+    )
+    return len(documents), await _mark_submissions(documents, condition, "reminder_sent_at", "reminder")
+
+async def purge_expired(batch_size: int):
+    now = datetime.utcnow()
+    tombstones = await storage.submission_tombstones.purge(now - timedelta(days=TOMBSTONE_RETENTION_DAYS), batch_size)
+    events = 0
+    if AUDIT_RETENTION_DAYS > 0:
+        events = await storage.submission_events.purge(now - timedelta(days=AUDIT_RETENTION_DAYS), batch_size)
+    return max(tombstones, events), tombstones + events
+
+class Job:
+    def __init__(self, name: str, interval: float, sweep):
+        self.name = name
+        self.interval = interval
+        self.sweep = sweep
+        self.last_run = None
+        self.last_outcome = None
+        self.last_items = 0
+        self.last_duration = None
+
+    def status(self):
+        return {
+            "job": self.name,
+            "interval_seconds": self.interval,
+            "last_run": self.last_run,
+            "last_outcome": self.last_outcome,
+            "last_items": self.last_items,
+            "last_duration_seconds": self.last_duration,
+        }
+
+class Scheduler:
+    def __init__(self, jobs, owner: str = None):
+        self.jobs = {job.name: job for job in jobs}
+        # Identifies this process in the leases
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._tasks = []
+
+    # Runs the job if this worker gets its lease; returns the outcome
+    async def run_job(self, job: Job):
+        if not await storage.leases.acquire(job.name, self.owner, job.interval):
+            scheduler_job_runs_total.inc(job.name, "skipped")
+            return "skipped"
+        started = time.perf_counter()
+        job.last_run = datetime.utcnow()
+        items = 0
+        outcome = "ok"
+        try:
+            for _ in range(JOB_MAX_BATCHES):
+                read, processed = await job.sweep(JOB_BATCH_SIZE)
+                items += processed
+                if read < JOB_BATCH_SIZE:
+                    break
+                await asyncio.sleep(JOB_BATCH_PAUSE_SECONDS)
+                if not await storage.leases.renew(job.name, self.owner, job.interval):
+                    logger.warning("Lost the lease of job %s, stopping the run", job.name)
+                    break
+        except Exception:
+            # A failing job must not stop the scheduler; the next run retries
+            outcome = "error"
+            logger.exception("Job %s failed", job.name)
+        duration = time.perf_counter() - started
+        job.last_outcome, job.last_items, job.last_duration = outcome, items, duration
+        scheduler_job_runs_total.inc(job.name, outcome)
+        scheduler_job_duration_seconds.observe(job.name, value=duration)
+        scheduler_job_items_total.inc(job.name, amount=items)
+        if outcome == "ok":
+            scheduler_job_last_success_seconds.set(job.name, value=time.time())
+        return outcome
+
+    async def _loop(self, job: Job):
+        # A random first delay spreads the workers over the interval
+        await asyncio.sleep(random.uniform(0, job.interval * JOB_JITTER))
+        while True:
+            try:
+                await self.run_job(job)
+            except Exception:
+                # The lease could not be read, e.g. the database is down
+                scheduler_job_runs_total.inc(job.name, "error")
+                logger.exception("Could not run job %s", job.name)
+            await asyncio.sleep(job.interval * random.uniform(1 - JOB_JITTER, 1 + JOB_JITTER))
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._loop(job)) for job in self.jobs.values()]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def status(self):
+        return [job.status() for job in self.jobs.values()]
+
+JOBS = [
+    Job("escalate_stale_pending", 3600, escalate_stale_pending),
+    Job("event_reminders", 900, remind_upcoming_events),
+    Job("purge_expired", 3600, purge_expired),
+]
+
+scheduler = Scheduler(JOBS)
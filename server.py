@@ -0,0 +1,63 @@
+# Production entry point.
+#
+#   python server.py --workers 4
+#
+# Runs the one-time startup tasks (indexes, statistics rollups) once in this
+# process, then starts uvicorn with N worker processes and SKIP_STARTUP_TASKS=1.
+# Workers are spawned fresh and import main themselves; each one opens its own
+# MongoDB client in the lifespan startup, so no client, pool or event loop is
+# shared between processes.
+#
+# With gunicorn, run the startup tasks first and start the workers without
+# --preload:
+#   python server.py --prepare-only
+#   SKIP_STARTUP_TASKS=1 gunicorn main:app -k uvicorn.workers.UvicornWorker -w 4 -b 0.0.0.0:8888
+#
+# The memory and SQLite storage engines run a single worker: with memory each
+# process would have a dataset of its own, and SQLite is meant for small
+# single-process deployments (its events stream only reaches clients of the
+# process that made the write).
+import argparse
+import asyncio
+import os
+import storage
+
+async def prepare():
+    from main import run_startup_tasks
+    try:
+        await run_startup_tasks()
+    finally:
+        storage.get_store().close()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8888")))
+    default_workers = (os.cpu_count() or 1) if storage.STORAGE_ENGINE == "mongo" else 1
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(default_workers))))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    # Proxies whose X-Forwarded-For / X-Forwarded-Proto headers are trusted
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+    parser.add_argument("--prepare-only", action="store_true", help="run the startup tasks and exit")
+    args = parser.parse_args()
+    if args.workers > 1 and storage.STORAGE_ENGINE != "mongo":
+        parser.error(f"STORAGE_ENGINE={storage.STORAGE_ENGINE} supports a single worker, got --workers {args.workers}")
+
+    asyncio.run(prepare())
+    if args.prepare_only:
+        return
+    # Inherited by the worker processes
+    os.environ["SKIP_STARTUP_TASKS"] = "1"
+
+    import uvicorn
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+    )
+
+if __name__ == "__main__":
+    main()
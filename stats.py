@@ -0,0 +1,147 @@
+# Dashboard statistics.
+#
+# Counts and budget totals are kept in the submission_stats rollup collection,
+# one document per (kind, key): the overall total, each status and each
+# organization. Every write path applies $inc deltas computed from the
+# submission before and after the change, so reading them never scans
+# submissions. Pending age percentiles and upcoming events use indexed queries
+# and are cached for STATS_CACHE_SECONDS.
+import time
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+import storage
+
+STATS_CACHE_SECONDS = 30
+UPCOMING_WEEKS = 8
+PENDING_AGE_PERCENTILES = [50, 90, 99]
+
+# Fields of a submission the rollups depend on
+ROLLUP_PROJECTION = {"status": 1, "budget": 1, "organization_name": 1}
+
+def _rollup_keys(submission):
+    return [
+        ("total", ""),
+        ("status", submission.get("status")),
+        ("organization", submission.get("organization_name")),
+    ]
+
+def rollup_operations(before, after):
+    # before/after are the submission before and after a write (None for create/delete)
+    deltas = {}
+    for submission, sign in ((before, -1), (after, 1)):
+        if submission is None:
+            continue
+        for kind, key in _rollup_keys(submission):
+            delta = deltas.setdefault((kind, key), [0, 0])
+            delta[0] += sign
+            delta[1] += sign * (submission.get("budget") or 0)
+    return [
+        UpdateOne(
+            {"_id": f"{kind}:{key}"},
+            {"$inc": {"count": count, "budget": budget}, "$setOnInsert": {"kind": kind, "key": key}},
+            upsert=True
+        )
+        for (kind, key), (count, budget) in deltas.items() if count or budget
+    ]
+
+async def update_rollups(db, changes):
+    # changes: list of (before, after) pairs. Rollups are only kept on MongoDB;
+    # the statistics endpoints are not available on the other storage engines.
+    if not storage.is_mongo():
+        return
+    operations = []
+    for before, after in changes:
+        operations.extend(rollup_operations(before, after))
+    if operations:
+        await db.submission_stats.bulk_write(operations, ordered=False)
+
+# Recompute the rollups from scratch with one aggregation over submissions
+async def rebuild_rollups(db):
+    pipeline = [{"$facet": {
+        "total": [{"$group": {"_id": "", "count": {"$sum": 1}, "budget": {"$sum": "$budget"}}}],
+        "status": [{"$group": {"_id": "$status", "count": {"$sum": 1}, "budget": {"$sum": "$budget"}}}],
+        "organization": [{"$group": {"_id": "$organization_name", "count": {"$sum": 1}, "budget": {"$sum": "$budget"}}}],
+    }}]
+    result = await db.submissions.aggregate(pipeline).to_list(1)
+    documents = [
+        {"_id": f"{kind}:{group['_id']}", "kind": kind, "key": group["_id"], "count": group["count"], "budget": group["budget"]}
+        for kind, groups in result[0].items() for group in groups
+    ]
+    await db.submission_stats.delete_many({})
+    if documents:
+        await db.submission_stats.insert_many(documents)
+    _cache.clear()
+
+async def ensure_rollups(db):
+    if not await db.submission_stats.find_one({"_id": "total:"}) and await db.submissions.find_one({}, {"_id": 1}):
+        await rebuild_rollups(db)
+
+async def _pending_age_percentiles(db, pending_count, now):
+    # Walk the status+created_at index to the n-th oldest pending submission
+    ages = {}
+    for p in PENDING_AGE_PERCENTILES:
+        if pending_count == 0:
+            ages[f"p{p}"] = None
+            continue
+        # p-th percentile of age = (100-p)-th percentile of created_at
+        offset = min(pending_count - 1, int((100 - p) / 100 * pending_count))
+        docs = await db.submissions.find({"status": "pending"}, {"created_at": 1}).sort(
+            [("created_at", 1), ("_id", 1)]
+        ).skip(offset).limit(1).to_list(1)
+        ages[f"p{p}"] = round((now - docs[0]["created_at"]).total_seconds() / 86400, 2) if docs else None
+    return ages
+
+async def _upcoming_events_per_week(db, now):
+    end = now + timedelta(weeks=UPCOMING_WEEKS)
+    pipeline = [
+        {"$match": {"event_datetime": {"$gte": now, "$lt": end}}},
+        {"$group": {
+            "_id": {"year": {"$isoWeekYear": "$event_datetime"}, "week": {"$isoWeek": "$event_datetime"}},
+            "count": {"$sum": 1},
+            "approved": {"$sum": {"$cond": [{"$eq": ["$status", "approved"]}, 1, 0]}},
+        }},
+        {"$sort": {"_id.year": 1, "_id.week": 1}},
+    ]
+    weeks = await db.submissions.aggregate(pipeline).to_list(None)
+    return [
+        {"week": f"{w['_id']['year']}-W{w['_id']['week']:02d}", "count": w["count"], "approved": w["approved"]}
+        for w in weeks
+    ]
+
+_cache = {}
+
+async def get_stats(db):
+    rollups = await db.submission_stats.find().to_list(None)
+    by_status, by_organization = {}, {}
+    total = {"count": 0, "budget": 0}
+    for doc in rollups:
+        if doc["count"] <= 0:
+            continue
+        entry = {"count": doc["count"], "budget": doc["budget"]}
+        if doc["kind"] == "total":
+            total = entry
+        elif doc["kind"] == "status":
+            by_status[doc["key"]] = entry
+        elif doc["kind"] == "organization":
+            by_organization[doc["key"]] = entry
+
+    cached = _cache.get("computed")
+    if cached is None or cached[0] < time.monotonic():
+        now = datetime.utcnow()
+        pending_count = by_status.get("pending", {}).get("count", 0)
+        computed = {
+            "pending_age_days": await _pending_age_percentiles(db, pending_count, now),
+            "upcoming_events_per_week": await _upcoming_events_per_week(db, now),
+        }
+        _cache["computed"] = (time.monotonic() + STATS_CACHE_SECONDS, computed)
+    else:
+        computed = cached[1]
+
+    return {
+        "total": total["count"],
+        "total_budget": total["budget"],
+        "average_budget": round(total["budget"] / total["count"], 2) if total["count"] else 0,
+        "by_status": by_status,
+        "by_organization": by_organization,
+        **computed,
+    }
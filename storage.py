@@ -0,0 +1,845 @@
+# Storage engines and repositories.
+#
+# Handlers read and write users, submissions, comments and audit events through
+# the repositories at the bottom of this module instead of the Motor database.
+# Queries and updates keep MongoDB's syntax; STORAGE_ENGINE picks where they run:
+#   mongo  - MongoDB through Motor (database.py), the default
+#   memory - dicts in this process with hash indexes on the lookup fields; for
+#            tests and benchmarks, nothing is persisted
+#   sqlite - a table per collection in SQLITE_PATH holding each document as
+#            Extended JSON plus indexed columns for the lookup and sort
+#            fields; for small single-process deployments
+# The memory and SQLite engines support the subset of the query language the
+# API uses (see match() and apply_update()). Full-text search, statistics and
+# query plans need MongoDB.
+import asyncio
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from bson import ObjectId, json_util
+from pymongo import InsertOne, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+import database
+
+STORAGE_ENGINE = os.getenv("STORAGE_ENGINE", "mongo")  # "mongo", "memory" or "sqlite"
+SQLITE_PATH = os.getenv("SQLITE_PATH", "sopas.db")
+
+# Fields looked up by equality (hash indexes in memory, B-tree in SQLite) and
+# fields sorted on (B-tree with _id in SQLite), per collection
+LOOKUP_FIELDS = {
+    "users": ["username"],
+    "submissions": ["student_id", "status"],
+    "comments": ["submission_id"],
+    "submission_events": ["submission_id"],
+    "submission_tombstones": ["student_id"],
+}
+SORT_FIELDS = {
+    "submissions": ["created_at", "seq"],
+    "comments": ["timestamp"],
+    "submission_events": ["timestamp"],
+    "submission_tombstones": ["seq", "deleted_at"],
+}
+UNIQUE_FIELDS = {"users": ["username"]}
+
+# Failure of the memory or SQLite engine other than a duplicate key
+class StorageError(Exception):
+    pass
+
+# Query language subset
+
+def _is_operator_dict(value):
+    return isinstance(value, dict) and bool(value) and all(k.startswith("$") for k in value)
+
+def _compare(op, value, operand):
+    if op == "$eq":
+        return value == operand
+    if op == "$ne":
+        return value != operand
+    if op == "$in":
+        return value in operand
+    if op == "$nin":
+        return value not in operand
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        # Like MongoDB, missing fields and other types never match a range
+        if value is None or operand is None:
+            return False
+        try:
+            return {"$gt": value > operand, "$gte": value >= operand, "$lt": value < operand, "$lte": value <= operand}[op]
+        except TypeError:
+            return False
+    raise StorageError(f"Query operator {op} is not supported by the {STORAGE_ENGINE} storage engine")
+
+def match(document, query):
+    for key, condition in query.items():
+        if key == "$and":
+            if not all(match(document, q) for q in condition):
+                return False
+        elif key == "$or":
+            if not any(match(document, q) for q in condition):
+                return False
+        elif key.startswith("$"):
+            raise StorageError(f"Query operator {key} is not supported by the {STORAGE_ENGINE} storage engine")
+        elif _is_operator_dict(condition):
+            value = document.get(key)
+            if not all(_compare(op, value, operand) for op, operand in condition.items()):
+                return False
+        elif document.get(key) != condition:
+            return False
+    return True
+
+def project(document, projection):
+    if not projection:
+        return dict(document)
+    included = [f for f, v in projection.items() if v == 1 or v is True]
+    if included:
+        result = {f: document[f] for f in included if f in document}
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+    excluded = {f for f, v in projection.items() if v == 0 or v is False}
+    return {f: v for f, v in document.items() if f not in excluded}
+
+def _sort_spec(sort):
+    if not sort:
+        return []
+    if isinstance(sort, str):
+        return [(sort, 1)]
+    return list(sort)
+
+def sort_documents(documents, sort):
+    # Stable sorts from the last key to the first; missing values sort first
+    for field, direction in reversed(_sort_spec(sort)):
+        documents.sort(
+            key=lambda d: (d.get(field) is not None, d.get(field) if d.get(field) is not None else 0),
+            reverse=direction < 0
+        )
+    return documents
+
+def apply_update(document, update, inserting=False):
+    for op, fields in update.items():
+        for field, value in fields.items():
+            if op == "$set":
+                document[field] = value
+            elif op == "$inc":
+                document[field] = (document.get(field) or 0) + value
+            elif op == "$max":
+                if document.get(field) is None or value > document[field]:
+                    document[field] = value
+            elif op == "$min":
+                if document.get(field) is None or value < document[field]:
+                    document[field] = value
+            elif op == "$unset":
+                document.pop(field, None)
+            elif op == "$setOnInsert":
+                if inserting:
+                    document[field] = value
+            else:
+                raise StorageError(f"Update operator {op} is not supported by the {STORAGE_ENGINE} storage engine")
+    return document
+
+def bson_value(value):
+    # The value as it reads back from MongoDB: datetimes keep milliseconds
+    if isinstance(value, datetime):
+        return value.replace(microsecond=value.microsecond // 1000 * 1000)
+    if isinstance(value, dict):
+        return {k: bson_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [bson_value(v) for v in value]
+    return value
+
+def upsert_document(query, update):
+    # New document for an upsert: the query's equality conditions plus the update
+    document = {k: v for k, v in query.items() if not k.startswith("$") and not _is_operator_dict(v)}
+    return apply_update(document, update, inserting=True)
+
+def _duplicate_key(collection, field):
+    return DuplicateKeyError(f"E11000 duplicate key error collection: {collection} index: {field}", 11000)
+
+# Collections. Every engine offers the same async interface; the base class
+# builds the convenience methods on the engine's primitives.
+class DocumentCollection:
+    async def find(self, query, projection=None, sort=None, skip=0, limit=0):
+        raise NotImplementedError
+
+    async def insert_one(self, document):
+        raise NotImplementedError
+
+    async def find_one_and_update(self, query, update, projection=None, return_after=False, upsert=False):
+        raise NotImplementedError
+
+    async def find_one_and_delete(self, query, projection=None):
+        raise NotImplementedError
+
+    async def delete_many(self, query):
+        raise NotImplementedError
+
+    async def find_one(self, query, projection=None):
+        documents = await self.find(query, projection, limit=1)
+        return documents[0] if documents else None
+
+    # Deletes the first limit matching documents in sort order, returns how many
+    async def delete_batch(self, query, sort, limit):
+        documents = await self.find(query, {"_id": 1}, sort, limit=limit)
+        if not documents:
+            return 0
+        return await self.delete_many({"_id": {"$in": [document["_id"] for document in documents]}})
+
+    async def iterate(self, query, projection=None, sort=None, batch_size=1000):
+        for document in await self.find(query, projection, sort):
+            yield document
+
+    async def update_one(self, query, update):
+        return await self.find_one_and_update(query, update, {"_id": 1}) is not None
+
+    # Unordered batches: returns {index: {"code": ..., "message": ...}} for the
+    # operations that failed
+    async def insert_each(self, documents):
+        errors = {}
+        for index, document in enumerate(documents):
+            try:
+                await self.insert_one(document)
+            except DuplicateKeyError as e:
+                errors[index] = {"code": 11000, "message": str(e)}
+        return errors
+
+    async def update_each(self, operations, upsert=False):
+        errors = {}
+        for index, (query, update) in enumerate(operations):
+            try:
+                await self.find_one_and_update(query, update, {"_id": 1}, upsert=upsert)
+            except DuplicateKeyError as e:
+                errors[index] = {"code": 11000, "message": str(e)}
+        return errors
+
+class MongoCollection(DocumentCollection):
+    def __init__(self, name: str):
+        self.name = name
+
+    @property
+    def _collection(self):
+        return database.db[self.name]
+
+    async def find(self, query, projection=None, sort=None, skip=0, limit=0):
+        cursor = self._collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(limit or None)
+
+    async def find_one(self, query, projection=None):
+        return await self._collection.find_one(query, projection)
+
+    async def iterate(self, query, projection=None, sort=None, batch_size=1000):
+        cursor = self._collection.find(query, projection).batch_size(batch_size)
+        if sort:
+            cursor = cursor.sort(sort)
+        async for document in cursor:
+            yield document
+
+    async def insert_one(self, document):
+        return (await self._collection.insert_one(document)).inserted_id
+
+    async def update_one(self, query, update):
+        return (await self._collection.update_one(query, update)).matched_count > 0
+
+    async def find_one_and_update(self, query, update, projection=None, return_after=False, upsert=False):
+        return await self._collection.find_one_and_update(
+            query, update, projection=projection, upsert=upsert,
+            return_document=ReturnDocument.AFTER if return_after else ReturnDocument.BEFORE
+        )
+
+    async def find_one_and_delete(self, query, projection=None):
+        return await self._collection.find_one_and_delete(query, projection=projection)
+
+    async def delete_many(self, query):
+        return (await self._collection.delete_many(query)).deleted_count
+
+    # One unordered bulk_write per batch
+    async def _bulk_write(self, operations):
+        if not operations:
+            return {}
+        try:
+            await self._collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            return {
+                error["index"]: {"code": error.get("code"), "message": error.get("errmsg", "Write failed")}
+                for error in e.details.get("writeErrors", [])
+            }
+        return {}
+
+    async def insert_each(self, documents):
+        return await self._bulk_write([InsertOne(document) for document in documents])
+
+    async def update_each(self, operations, upsert=False):
+        return await self._bulk_write([UpdateOne(query, update, upsert=upsert) for query, update in operations])
+
+class MemoryCollection(DocumentCollection):
+    def __init__(self, name: str):
+        self.name = name
+        self._documents = {}
+        # field -> value -> set of _id
+        self._indexes = {field: {} for field in LOOKUP_FIELDS.get(name, [])}
+        self._unique = UNIQUE_FIELDS.get(name, [])
+
+    def _index(self, document, add=True):
+        for field, index in self._indexes.items():
+            value = document.get(field)
+            if add:
+                index.setdefault(value, set()).add(document["_id"])
+            else:
+                ids = index.get(value)
+                ids.discard(document["_id"])
+                if not ids:
+                    del index[value]
+
+    def _check_unique(self, document):
+        for field in self._unique:
+            if self._indexes[field].get(document.get(field), set()) - {document["_id"]}:
+                raise _duplicate_key(self.name, field)
+
+    def _candidates(self, query):
+        # Narrow with _id or an indexed equality condition, otherwise scan
+        oid = query.get("_id")
+        if oid is not None and not isinstance(oid, dict):
+            return [self._documents[oid]] if oid in self._documents else []
+        if isinstance(oid, dict) and set(oid) == {"$in"}:
+            return [self._documents[i] for i in oid["$in"] if i in self._documents]
+        for field, index in self._indexes.items():
+            value = query.get(field)
+            if value is not None and not isinstance(value, dict):
+                return [self._documents[i] for i in index.get(value, ())]
+        return list(self._documents.values())
+
+    def _matching(self, query):
+        return [d for d in self._candidates(query) if match(d, query)]
+
+    def _insert(self, document):
+        document.setdefault("_id", ObjectId())
+        if document["_id"] in self._documents:
+            raise _duplicate_key(self.name, "_id")
+        stored = bson_value(document)
+        self._check_unique(stored)
+        self._documents[stored["_id"]] = stored
+        self._index(stored)
+        return stored["_id"]
+
+    # Each operation yields to the event loop once before it runs, as a driver
+    # round trip would, so a client looping over the store cannot starve the
+    # others. Nothing awaits after that point, which keeps operations atomic.
+
+    async def find(self, query, projection=None, sort=None, skip=0, limit=0):
+        await asyncio.sleep(0)
+        documents = self._matching(query)
+        if sort:
+            sort_documents(documents, sort)
+        documents = documents[skip:skip + limit] if limit else documents[skip:]
+        return [project(d, projection) for d in documents]
+
+    async def insert_one(self, document):
+        await asyncio.sleep(0)
+        return self._insert(document)
+
+    async def find_one_and_update(self, query, update, projection=None, return_after=False, upsert=False):
+        await asyncio.sleep(0)
+        documents = self._matching(query)
+        if not documents:
+            if not upsert:
+                return None
+            document = upsert_document(query, update)
+            self._insert(document)
+            return project(document, projection) if return_after else None
+        before = documents[0]
+        after = bson_value(apply_update(dict(before), update))
+        self._check_unique(after)
+        self._index(before, add=False)
+        self._documents[after["_id"]] = after
+        self._index(after)
+        return project(after if return_after else before, projection)
+
+    async def find_one_and_delete(self, query, projection=None):
+        await asyncio.sleep(0)
+        documents = self._matching(query)
+        if not documents:
+            return None
+        document = self._documents.pop(documents[0]["_id"])
+        self._index(document, add=False)
+        return project(document, projection)
+
+    async def delete_many(self, query):
+        await asyncio.sleep(0)
+        documents = self._matching(query)
+        for document in documents:
+            del self._documents[document["_id"]]
+            self._index(document, add=False)
+        return len(documents)
+
+# Extended JSON keeps ObjectIds and (naive, UTC) datetimes across the round trip
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=False)
+SQL_OPERATORS = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+def _sql_value(value):
+    # Column encoding that sorts like MongoDB: ObjectIds as hex, datetimes as
+    # fixed-width ISO text, truncated to milliseconds like BSON dates (and the
+    # stored document)
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3]
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+# The connection is in autocommit mode. Operations that read before they write
+# run in a transaction started with BEGIN IMMEDIATE, which takes the database
+# write lock up front: the executor thread only serialises operations within
+# one process, the lock also serialises them against other processes using
+# the file (a migration script, a second server). Nested uses join the
+# transaction already open.
+@contextmanager
+def _transaction(connection):
+    if connection.in_transaction:
+        yield
+        return
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+class SQLiteCollection(DocumentCollection):
+    def __init__(self, store, name: str):
+        self.name = name
+        self._store = store
+        self.columns = LOOKUP_FIELDS.get(name, []) + SORT_FIELDS.get(name, [])
+        self._created = False
+
+    def _create(self, connection):
+        if self._created:
+            return
+        with _transaction(connection):
+            self._create_table(connection)
+        self._created = True
+
+    def _create_table(self, connection):
+        columns = "".join(f', "{c}"' for c in self.columns)
+        connection.execute(f'CREATE TABLE IF NOT EXISTS "{self.name}" (_id TEXT PRIMARY KEY, doc TEXT NOT NULL{columns})')
+        # Tables from an older version: add the new columns and fill them from the documents
+        existing = {row[1] for row in connection.execute(f'PRAGMA table_info("{self.name}")')}
+        added = [c for c in self.columns if c not in existing]
+        for column in added:
+            connection.execute(f'ALTER TABLE "{self.name}" ADD COLUMN "{column}"')
+        if added:
+            assignments = ", ".join(f'"{c}" = ?' for c in added)
+            for _id, doc in connection.execute(f'SELECT _id, doc FROM "{self.name}"').fetchall():
+                document = json_util.loads(doc, json_options=JSON_OPTIONS)
+                connection.execute(
+                    f'UPDATE "{self.name}" SET {assignments} WHERE _id = ?',
+                    [_sql_value(document.get(c)) for c in added] + [_id]
+                )
+        for column in LOOKUP_FIELDS.get(self.name, []):
+            unique = "UNIQUE " if column in UNIQUE_FIELDS.get(self.name, []) else ""
+            connection.execute(f'CREATE {unique}INDEX IF NOT EXISTS "{self.name}_{column}" ON "{self.name}" ("{column}")')
+        for column in SORT_FIELDS.get(self.name, []):
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{self.name}_{column}_id" ON "{self.name}" ("{column}", _id)')
+
+    def _condition(self, field, condition):
+        # SQL for one field condition, or None when it cannot be translated
+        if field != "_id" and field not in self.columns:
+            return None
+        column = f'"{field}"'
+        items = condition.items() if _is_operator_dict(condition) else [("$eq", condition)]
+        clauses, params = [], []
+        for op, operand in items:
+            if op == "$eq":
+                if operand is None:
+                    clauses.append(f"{column} IS NULL")
+                else:
+                    clauses.append(f"{column} = ?")
+                    params.append(_sql_value(operand))
+            elif op == "$ne":
+                if operand is None:
+                    clauses.append(f"{column} IS NOT NULL")
+                else:
+                    clauses.append(f"({column} != ? OR {column} IS NULL)")
+                    params.append(_sql_value(operand))
+            elif op == "$in":
+                values = [_sql_value(v) for v in operand if v is not None]
+                parts = [f"{column} IN ({', '.join('?' * len(values))})"] if values else []
+                if None in operand:
+                    parts.append(f"{column} IS NULL")
+                clauses.append(f"({' OR '.join(parts) or '0'})")
+                params.extend(values)
+            elif op in SQL_OPERATORS:
+                clauses.append(f"{column} {SQL_OPERATORS[op]} ?")
+                params.append(_sql_value(operand))
+            else:
+                return None
+        return " AND ".join(clauses), params
+
+    def _translate(self, query):
+        # Splits a query into SQL for the parts on indexed columns and a
+        # residual query matched in Python
+        clauses, params, residual = [], [], {}
+        for key, condition in query.items():
+            if key in ("$and", "$or"):
+                parts = [self._translate(q) for q in condition]
+                if all(not r for _, _, r in parts):
+                    joiner = " AND " if key == "$and" else " OR "
+                    clauses.append("(" + joiner.join(f"({sql})" for sql, _, _ in parts) + ")")
+                    params.extend(p for _, ps, _ in parts for p in ps)
+                    continue
+                residual[key] = condition
+                continue
+            translated = None if key.startswith("$") else self._condition(key, condition)
+            if translated is None:
+                residual[key] = condition
+            else:
+                clauses.append(translated[0])
+                params.extend(translated[1])
+        return " AND ".join(clauses) or "1", params, residual
+
+    def _select(self, connection, query, sort=None, skip=0, limit=0):
+        self._create(connection)
+        where, params, residual = self._translate(query)
+        spec = _sort_spec(sort)
+        sql = f'SELECT doc FROM "{self.name}" WHERE {where}'
+        # Ordering and paging run in SQL when nothing is left to match in Python
+        pushdown = not residual and all(f == "_id" or f in self.columns for f, _ in spec)
+        if pushdown:
+            if spec:
+                sql += " ORDER BY " + ", ".join(f'"{f}" {"DESC" if d < 0 else "ASC"}' for f, d in spec)
+            if limit or skip:
+                sql += f" LIMIT {int(limit) if limit else -1} OFFSET {int(skip)}"
+        documents = [json_util.loads(row[0], json_options=JSON_OPTIONS) for row in connection.execute(sql, params)]
+        if not pushdown:
+            documents = [d for d in documents if match(d, residual)]
+            if spec:
+                sort_documents(documents, spec)
+            documents = documents[skip:skip + limit] if limit else documents[skip:]
+        return documents
+
+    def _write(self, connection, document, replace=False):
+        values = [json_util.dumps(document, json_options=JSON_OPTIONS)]
+        values += [_sql_value(document.get(c)) for c in self.columns]
+        columns = ["doc"] + [f'"{c}"' for c in self.columns]
+        try:
+            if replace:
+                assignments = ", ".join(f"{c} = ?" for c in columns)
+                connection.execute(f'UPDATE "{self.name}" SET {assignments} WHERE _id = ?', values + [str(document["_id"])])
+            else:
+                placeholders = ", ".join("?" * (len(values) + 1))
+                connection.execute(
+                    f'INSERT INTO "{self.name}" (_id, {", ".join(columns)}) VALUES ({placeholders})',
+                    [str(document["_id"])] + values
+                )
+        except sqlite3.IntegrityError as e:
+            raise _duplicate_key(self.name, str(e))
+
+    def _find_sync(self, connection, query, projection, sort, skip, limit):
+        return [project(d, projection) for d in self._select(connection, query, sort, skip, limit)]
+
+    def _insert_sync(self, connection, document):
+        document.setdefault("_id", ObjectId())
+        self._create(connection)
+        self._write(connection, document)
+        return document["_id"]
+
+    def _find_one_and_update_sync(self, connection, query, update, projection, return_after, upsert):
+        with _transaction(connection):
+            documents = self._select(connection, query, limit=1)
+            if not documents:
+                if not upsert:
+                    return None
+                document = upsert_document(query, update)
+                self._insert_sync(connection, document)
+                return project(document, projection) if return_after else None
+            before = documents[0]
+            after = apply_update(dict(before), update)
+            self._write(connection, after, replace=True)
+        return project(after if return_after else before, projection)
+
+    def _delete_sync(self, connection, query, many):
+        with _transaction(connection):
+            documents = self._select(connection, query, limit=0 if many else 1)
+            for document in documents:
+                connection.execute(f'DELETE FROM "{self.name}" WHERE _id = ?', [str(document["_id"])])
+        return documents
+
+    async def find(self, query, projection=None, sort=None, skip=0, limit=0):
+        return await self._store.run(self._find_sync, query, projection, sort, skip, limit)
+
+    async def insert_one(self, document):
+        return await self._store.run(self._insert_sync, document)
+
+    async def find_one_and_update(self, query, update, projection=None, return_after=False, upsert=False):
+        return await self._store.run(self._find_one_and_update_sync, query, update, projection, return_after, upsert)
+
+    async def find_one_and_delete(self, query, projection=None):
+        documents = await self._store.run(self._delete_sync, query, False)
+        return project(documents[0], projection) if documents else None
+
+    async def delete_many(self, query):
+        return len(await self._store.run(self._delete_sync, query, True))
+
+# Stores: one per process, holding the engine's collections
+
+class MongoStore:
+    engine = "mongo"
+
+    def __init__(self):
+        self._collections = {}
+
+    def collection(self, name: str):
+        if name not in self._collections:
+            self._collections[name] = MongoCollection(name)
+        return self._collections[name]
+
+    def connect(self):
+        database.connect()
+
+    def close(self):
+        database.close()
+
+    async def ping(self):
+        await database.ping()
+
+class MemoryStore(MongoStore):
+    engine = "memory"
+
+    def collection(self, name: str):
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name)
+        return self._collections[name]
+
+    def connect(self):
+        pass
+
+    def close(self):
+        pass
+
+    async def ping(self):
+        pass
+
+class SQLiteStore(MongoStore):
+    engine = "sqlite"
+
+    def __init__(self, path: str = SQLITE_PATH):
+        super().__init__()
+        self.path = path
+        self._connection = None
+        # A single thread owns the connection; see _transaction for other processes
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+
+    def collection(self, name: str):
+        if name not in self._collections:
+            self._collections[name] = SQLiteCollection(self, name)
+        return self._collections[name]
+
+    def _call(self, func, args):
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        try:
+            return func(self._connection, *args)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    async def run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, func, args)
+
+    def connect(self):
+        pass
+
+    def close(self):
+        if self._connection is not None:
+            self._executor.submit(self._connection.close).result()
+            self._connection = None
+
+    async def ping(self):
+        await self.run(lambda connection: connection.execute("SELECT 1"))
+
+def create_store(engine: str = STORAGE_ENGINE, sqlite_path: str = SQLITE_PATH):
+    if engine == "mongo":
+        return MongoStore()
+    if engine == "memory":
+        return MemoryStore()
+    if engine == "sqlite":
+        return SQLiteStore(sqlite_path)
+    raise ValueError(f"Unknown storage engine {engine!r}")
+
+# Process-wide store, created on first use (like the client in database.py)
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = create_store()
+    return _store
+
+def is_mongo():
+    return get_store().engine == "mongo"
+
+# Repositories
+
+class Repository:
+    collection_name = None
+
+    @property
+    def collection(self) -> DocumentCollection:
+        return get_store().collection(self.collection_name)
+
+class UserRepository(Repository):
+    collection_name = "users"
+
+    async def get(self, username: str, projection=None):
+        return await self.collection.find_one({"username": username}, projection)
+
+    async def create(self, user: dict):
+        return await self.collection.insert_one(user)
+
+    async def create_many(self, users: list):
+        return await self.collection.insert_each(users)
+
+    async def set_password(self, username: str, password_hash: str):
+        await self.collection.update_one({"username": username}, {"$set": {"password": password_hash}})
+
+    # Bumps the version, which revokes the tokens issued before the change
+    async def set_role(self, username: str, role: str):
+        return await self.collection.find_one_and_update(
+            {"username": username},
+            {"$set": {"role": role}, "$inc": {"version": 1}},
+            projection={"role": 1, "version": 1},
+            return_after=True
+        )
+
+class SubmissionRepository(Repository):
+    collection_name = "submissions"
+
+    async def create(self, submission: dict):
+        return await self.collection.insert_one(submission)
+
+    async def create_many(self, submissions: list):
+        return await self.collection.insert_each(submissions)
+
+    async def get(self, query: dict, projection=None):
+        return await self.collection.find_one(query, projection)
+
+    async def list(self, query: dict, projection=None, sort=None, limit=0, skip=0):
+        return await self.collection.find(query, projection, sort, skip, limit)
+
+    def iterate(self, query: dict, projection=None, sort=None, batch_size=1000):
+        return self.collection.iterate(query, projection, sort, batch_size)
+
+    async def by_ids(self, oids: list, projection=None):
+        documents = await self.collection.find({"_id": {"$in": oids}}, projection or {"_id": 1})
+        return {document["_id"]: document for document in documents}
+
+    # Returns the submission as it was before the update, or None if nothing matched
+    async def update(self, query: dict, update: dict, projection=None):
+        return await self.collection.find_one_and_update(query, update, projection)
+
+    async def update_each(self, operations: list):
+        return await self.collection.update_each(operations)
+
+    async def delete(self, query: dict, projection=None):
+        return await self.collection.find_one_and_delete(query, projection)
+
+class CommentRepository(Repository):
+    collection_name = "comments"
+
+    async def add(self, comment: dict):
+        return await self.collection.insert_one(comment)
+
+    async def add_many(self, comments: list):
+        return await self.collection.insert_each(comments)
+
+    async def list(self, query: dict, limit=0):
+        return await self.collection.find(query, sort=[("timestamp", 1), ("_id", 1)], limit=limit)
+
+    async def delete_for_submission(self, submission_id: ObjectId):
+        return await self.collection.delete_many({"submission_id": submission_id})
+
+class SubmissionEventRepository(Repository):
+    collection_name = "submission_events"
+
+    async def add_many(self, events: list):
+        return await self.collection.insert_each(events)
+
+    async def list(self, query: dict, limit=0):
+        return await self.collection.find(query, sort=[("timestamp", 1), ("_id", 1)], limit=limit)
+
+    async def purge(self, cutoff: datetime, limit: int):
+        return await self.collection.delete_batch({"timestamp": {"$lt": cutoff}}, [("timestamp", 1), ("_id", 1)], limit)
+
+# Deleted submissions, reported by GET /submissions/changes
+class SubmissionTombstoneRepository(Repository):
+    collection_name = "submission_tombstones"
+
+    async def add(self, tombstone: dict):
+        return await self.collection.insert_one(tombstone)
+
+    async def list(self, query: dict, limit=0):
+        return await self.collection.find(query, sort=[("seq", 1)], limit=limit)
+
+    # MongoDB expires them with a TTL index, the other engines rely on this
+    async def purge(self, cutoff: datetime, limit: int):
+        return await self.collection.delete_batch({"deleted_at": {"$lt": cutoff}}, [("deleted_at", 1), ("_id", 1)], limit)
+
+# Named counters, e.g. the change sequence of the submissions
+class CounterRepository(Repository):
+    collection_name = "counters"
+
+    # Reserves count consecutive values and returns the last one
+    async def increment(self, name: str, count: int = 1):
+        update = {"$inc": {"value": count}}
+        try:
+            counter = await self.collection.find_one_and_update(
+                {"_id": name}, update, {"value": 1}, return_after=True, upsert=True
+            )
+        except DuplicateKeyError:
+            # Lost the race to create the counter, it exists now
+            counter = await self.collection.find_one_and_update({"_id": name}, update, {"value": 1}, return_after=True)
+        return counter["value"]
+
+# Time-limited locks, so that only one worker process runs a background job
+class LeaseRepository(Repository):
+    collection_name = "leases"
+
+    # Takes the lease if it is free, expired or already held by this owner;
+    # False while another owner holds it
+    async def acquire(self, name: str, owner: str, seconds: float):
+        now = datetime.utcnow()
+        try:
+            await self.collection.find_one_and_update(
+                {"_id": name, "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=seconds)}},
+                {"_id": 1}, upsert=True
+            )
+        except DuplicateKeyError:
+            # The lease exists, has not expired and belongs to someone else
+            return False
+        return True
+
+    # Extends a lease the owner still holds; False if it was lost
+    async def renew(self, name: str, owner: str, seconds: float):
+        lease = await self.collection.find_one_and_update(
+            {"_id": name, "owner": owner},
+            {"$set": {"expires_at": datetime.utcnow() + timedelta(seconds=seconds)}},
+            {"_id": 1}
+        )
+        return lease is not None
+
+users = UserRepository()
+submissions = SubmissionRepository()
+comments = CommentRepository()
+submission_events = SubmissionEventRepository()
+submission_tombstones = SubmissionTombstoneRepository()
+counters = CounterRepository()
+leases = LeaseRepository()
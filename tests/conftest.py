@@ -0,0 +1,130 @@
+# Shared setup for the API tests: the app on the memory storage engine with a
+# fresh store per test, cheap password hashes and no background jobs. These
+# settings are read at import, so they are set before main is imported.
+import os
+os.environ.setdefault("STORAGE_ENGINE", "memory")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("SCHEDULER_ENABLED", "0")
+
+import asyncio
+import httpx
+import pytest
+from bson import ObjectId
+from gridfs.errors import NoFile
+import attachments
+import database
+import storage
+from main import app
+from models import hash_pool, role_cache
+from ratelimit import InMemoryBackend, limiter
+
+class ApiClient(httpx.AsyncClient):
+    # Registers the user and returns the headers of a logged in request
+    async def login(self, username: str, role: str = "student", password: str = "secret"):
+        await self.post("/register", json={"username": username, "password": password, "role": role})
+        response = await self.post("/login", json={"username": username, "password": password})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+# api(scenario) runs the coroutine function scenario(client) against the app
+# (without the lifespan: the audit log writes through and events stay local)
+@pytest.fixture
+def api(monkeypatch):
+    monkeypatch.setattr(storage, "_store", storage.MemoryStore())
+    monkeypatch.setattr(limiter, "backend", InMemoryBackend())
+    monkeypatch.setattr(limiter, "enabled", False)
+    monkeypatch.setattr(role_cache, "_entries", type(role_cache._entries)())
+    # Bound to the event loop of its first use; every test runs its own loop
+    monkeypatch.setattr(hash_pool, "_semaphore", None)
+
+    def run(scenario):
+        async def main():
+            async with ApiClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await scenario(client)
+        return asyncio.run(main())
+    return run
+
+SUBMISSION = {
+    "title": "Fun run", "content": "A 5k around the campus", "project_head": "Ann", "budget": 100,
+    "venue": "Gym", "organization_name": "Runners", "event_date": "2030-01-01", "event_time": "10:00",
+}
+
+@pytest.fixture
+def submission_body():
+    return dict(SUBMISSION)
+
+class FakeUpload:
+    def __init__(self, bucket, filename, metadata):
+        self._id, self.filename, self.metadata = ObjectId(), filename, metadata
+        self.bucket, self.data, self.closed, self.aborted = bucket, bytearray(), False, False
+
+    async def writelines(self, parts):
+        for part in parts:
+            self.data += part
+
+    async def close(self):
+        self.closed = True
+        self.bucket.files[self._id] = self
+
+    async def abort(self):
+        self.closed = self.aborted = True
+
+class FakeDownload:
+    chunk_size = 4
+
+    def __init__(self, upload):
+        self.data, self.length = bytes(upload.data), len(upload.data)
+        self.filename, self.metadata, self.position = upload.filename, upload.metadata, 0
+
+    def seek(self, position):
+        self.position = position
+
+    async def read(self, size):
+        data = self.data[self.position:self.position + size]
+        self.position += len(data)
+        return data
+
+    def close(self):
+        pass
+
+class FakeBucket:
+    def __init__(self):
+        self.files, self.uploads = {}, []
+
+    def open_upload_stream(self, filename, metadata=None):
+        self.uploads.append(FakeUpload(self, filename, metadata))
+        return self.uploads[-1]
+
+    async def open_download_stream(self, file_id):
+        if file_id not in self.files:
+            raise NoFile()
+        return FakeDownload(self.files[file_id])
+
+    async def delete(self, file_id):
+        if self.files.pop(file_id, None) is None:
+            raise NoFile()
+
+    async def find(self, query):
+        for upload in list(self.files.values()):
+            if upload.metadata.get("submission_id") == query["metadata.submission_id"]:
+                yield upload
+
+# GridFS (attachments.get_bucket) replaced by an in-memory bucket
+@pytest.fixture
+def bucket(monkeypatch):
+    fake = FakeBucket()
+    monkeypatch.setattr(attachments, "get_bucket", lambda: fake)
+    return fake
+
+# The MongoDB engine on mongomock, for what the memory engine does not support
+@pytest.fixture
+def mongo_store(monkeypatch):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    client = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(database, "_client", client)
+    monkeypatch.setattr(database, "_database", client["sopas_test"])
+    # The unique index the memory and SQLite engines derive from UNIQUE_FIELDS
+    asyncio.run(client["sopas_test"]["users"].create_index("username", unique=True))
+    store = storage.MongoStore()
+    monkeypatch.setattr(storage, "_store", store)
+    return store
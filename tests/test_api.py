@@ -0,0 +1,295 @@
+# API tests on the memory engine (see conftest.py): conditional requests,
+# rate limiting, the changes feed and attachment downloads.
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+import main
+import storage
+from models import TOMBSTONE_RETENTION_DAYS, encode_change_token, next_change_seqs, role_cache
+from ratelimit import DEFAULT_LIMIT, LOGIN_USER_LIMIT, limiter
+
+async def create(client, headers, body):
+    response = await client.post("/submissions", json=body, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+def test_if_match(api, submission_body):
+    async def scenario(client):
+        student = await client.login("stu")
+        admin = await client.login("adm", "admin")
+        sid = await create(client, student, submission_body)
+        response = await client.get(f"/submissions/{sid}", headers=student)
+        assert response.headers["ETag"] == '"1"'
+
+        edit = {**submission_body, "title": "Fun run 2"}
+        response = await client.put(f"/submissions/{sid}", json=edit, headers={**student, "If-Match": '"1"'})
+        assert (response.status_code, response.headers["ETag"]) == (200, '"2"')
+        # Stale version: nothing is written
+        response = await client.put(f"/submissions/{sid}", json=submission_body, headers={**student, "If-Match": '"1"'})
+        assert response.status_code == 412
+        assert (await client.get(f"/submissions/{sid}", headers=student)).json()["title"] == "Fun run 2"
+        response = await client.put(f"/submissions/{sid}", json=edit, headers={**student, "If-Match": "W/\"2\""})
+        assert (response.status_code, response.headers["ETag"]) == (200, '"3"')
+        response = await client.put(f"/submissions/{sid}", json=edit, headers={**student, "If-Match": "soon"})
+        assert response.status_code == 400
+        # Unknown submission: 404, not 412
+        response = await client.put(f"/submissions/{ObjectId()}", json=edit, headers={**student, "If-Match": '"3"'})
+        assert response.status_code == 404
+
+        response = await client.put(f"/submissions/{sid}/status", json={"status": "approved"}, headers={**admin, "If-Match": '"2"'})
+        assert response.status_code == 412
+        response = await client.put(f"/submissions/{sid}/status", json={"status": "approved"}, headers={**admin, "If-Match": '"3"'})
+        assert (response.status_code, response.headers["ETag"]) == (200, '"4"')
+        response = await client.delete(f"/submissions/{sid}", headers={**student, "If-Match": '"3"'})
+        assert response.status_code == 412
+        assert (await client.delete(f"/submissions/{sid}", headers={**student, "If-Match": '"4"'})).status_code == 200
+    api(scenario)
+
+def test_list_if_none_match(api, submission_body):
+    async def scenario(client):
+        student = await client.login("stu")
+        admin = await client.login("adm", "admin")
+        sid = await create(client, student, submission_body)
+        response = await client.get("/submissions", headers=student)
+        tag = response.headers["ETag"]
+        assert len(response.json()) == 1
+
+        response = await client.get("/submissions", headers={**student, "If-None-Match": tag})
+        assert (response.status_code, response.content, response.headers["ETag"]) == (304, b"", tag)
+        # Another query, or another user, has another validator
+        response = await client.get("/submissions?view=summary", headers={**student, "If-None-Match": tag})
+        assert response.status_code == 200
+        response = await client.get("/submissions", headers={**admin, "If-None-Match": tag})
+        assert response.status_code == 200
+        # A comment changes the page
+        await client.post(f"/submissions/{sid}/comment", json={"comment": "Looks good"}, headers=admin)
+        response = await client.get("/submissions", headers={**student, "If-None-Match": tag})
+        assert response.status_code == 200 and response.headers["ETag"] != tag
+        assert response.json()[0]["comment_count"] == 1
+        # Weak comparison: the tag without its W/ prefix matches too
+        strong = response.headers["ETag"].removeprefix("W/")
+        response = await client.get("/submissions", headers={**student, "If-None-Match": f'"other", {strong}'})
+        assert response.status_code == 304
+    api(scenario)
+
+def test_role_change_revokes_tokens(api):
+    async def scenario(client):
+        admin = await client.login("adm", "admin")
+        demoted = await client.login("adm2", "admin")
+        assert (await client.get("/me", headers=demoted)).json()["role"] == "admin"
+        assert (await client.put("/users/adm2/role", json={"role": "student"}, headers=admin)).status_code == 200
+        response = await client.get("/me", headers=demoted)
+        assert (response.status_code, response.json()["detail"]) == (401, "Token revoked, log in again")
+        relogged = await client.login("adm2", "admin")
+        assert (await client.get("/me", headers=relogged)).json()["role"] == "student"
+
+        # Another worker still caching the old role: a token with a newer
+        # version makes it read the user again
+        role_cache.set("adm2", "admin", 1)
+        assert (await client.get("/me", headers=relogged)).json()["role"] == "student"
+        # Deleted users
+        await storage.users.collection.delete_many({"username": "adm"})
+        role_cache.invalidate("adm")
+        assert (await client.get("/me", headers=admin)).status_code == 401
+    api(scenario)
+
+def test_rate_limits(api, monkeypatch):
+    async def scenario(client):
+        first = await client.login("stu")
+        second = await client.login("stu2")
+        monkeypatch.setattr(limiter, "enabled", True)
+        # Per user: exhausting one user's bucket leaves the other's alone
+        statuses = [(await client.get("/me", headers=first)).status_code for _ in range(DEFAULT_LIMIT.burst + 10)]
+        assert statuses[:DEFAULT_LIMIT.burst] == [200] * DEFAULT_LIMIT.burst
+        assert statuses[-1] == 429
+        response = await client.get("/me", headers=first)
+        assert response.status_code == 429 and int(response.headers["Retry-After"]) >= 1
+        assert (await client.get("/me", headers=second)).status_code == 200
+        # Requests without a valid token share the client IP's bucket
+        assert (await client.get("/me", headers={"Authorization": "Bearer nope"})).status_code == 401
+        # Exempt paths
+        assert (await client.get("/metrics")).status_code == 200
+
+        # Logins are limited per username as well as per IP
+        statuses = [
+            (await client.post("/login", json={"username": "stu2", "password": "wrong"})).status_code
+            for _ in range(LOGIN_USER_LIMIT.burst)
+        ]
+        assert statuses == [401] * LOGIN_USER_LIMIT.burst
+        response = await client.post("/login", json={"username": "stu2", "password": "secret"})
+        assert response.status_code == 429
+    api(scenario)
+
+def test_changes_feed(api, submission_body, monkeypatch):
+    monkeypatch.setattr(main, "CHANGES_SETTLE_SECONDS", 0)
+
+    async def scenario(client):
+        student = await client.login("stu")
+        other = await client.login("stu2")
+        admin = await client.login("adm", "admin")
+        first = await create(client, student, submission_body)
+        second = await create(client, student, submission_body)
+        await create(client, other, submission_body)
+
+        page = (await client.get("/submissions/changes", headers=student)).json()
+        assert [doc["_id"] for doc in page["changed"]] == [first, second]
+        assert page["deleted"] == [] and not page["more"]
+        token = page["next"]
+        page = (await client.get("/submissions/changes", params={"since": token}, headers=student)).json()
+        assert page["changed"] == [] and page["deleted"] == []
+
+        await client.put(f"/submissions/{first}/status", json={"status": "approved"}, headers=admin)
+        await client.delete(f"/submissions/{second}", headers=student)
+        page = (await client.get("/submissions/changes", params={"since": token}, headers=student)).json()
+        assert [(doc["_id"], doc["status"]) for doc in page["changed"]] == [(first, "approved")]
+        assert [doc["_id"] for doc in page["deleted"]] == [second]
+        assert len((await client.get("/submissions/changes", headers=admin)).json()["changed"]) == 2
+        response = await client.get("/submissions/changes", params={"since": "garbage"}, headers=student)
+        assert response.status_code == 400
+    api(scenario)
+
+def test_comments_batch(api, submission_body, monkeypatch):
+    async def scenario(client):
+        student = await client.login("stu")
+        admin = await client.login("adm", "admin")
+        first = await create(client, student, submission_body)
+        second = await create(client, student, submission_body)
+        missing = str(ObjectId())
+        body = [{"id": first, "comment": "a"}, {"id": "bad", "comment": "b"}, {"id": missing, "comment": "c"}, {"id": second, "comment": "d"}]
+        response = await client.post("/submissions/comments:batch", json=body, headers=admin)
+        assert [(r["ok"], r.get("error")) for r in response.json()] == [
+            (True, None), (False, "Invalid submission ID"), (False, "Submission not found"), (True, None)
+        ]
+        assert await storage.comments.list({"submission_id": ObjectId(missing)}) == []
+        assert [e["submission_id"] for e in await storage.submission_events.list({"type": "comment"})] == [ObjectId(first), ObjectId(second)]
+        # Each item is stamped when its write is sent
+        for sid in [first, second]:
+            doc = await storage.submissions.get({"_id": ObjectId(sid)})
+            (comment,) = await storage.comments.list({"submission_id": ObjectId(sid)})
+            assert doc["comment_count"] == 1 and doc["last_comment_at"] == doc["updated_at"] == comment["timestamp"]
+
+        # Comment inserts that fail are reported on their item
+        async def add_many(comments):
+            return {0: {"code": 11000, "message": "duplicate key"}}
+        monkeypatch.setattr(storage.comments, "add_many", add_many)
+        response = await client.post("/submissions/comments:batch", json=[body[0], body[3]], headers=admin)
+        assert [(r["ok"], r.get("error")) for r in response.json()] == [(False, "duplicate key"), (True, None)]
+        assert len(await storage.submission_events.list({"type": "comment"})) == 3
+    api(scenario)
+
+async def changes(client, headers, token=None, **params):
+    if token:
+        params["since"] = token
+    response = await client.get("/submissions/changes", params=params, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+# Changes newer than the settle window are sent, but the token does not move
+# past them: a write that reserved a lower seq can still be in flight
+def test_changes_settle_window(api, submission_body, monkeypatch):
+    monkeypatch.setattr(main, "CHANGES_SETTLE_SECONDS", 60)
+
+    async def scenario(client):
+        student = await client.login("stu")
+        (in_flight,) = await next_change_seqs()
+        later = await create(client, student, submission_body)
+        page = await changes(client, student)
+        assert [doc["_id"] for doc in page["changed"]] == [later]
+        token = page["next"]
+
+        # The in-flight write lands with its lower seq
+        now = datetime.utcnow()
+        landed = ObjectId()
+        await storage.submissions.create({
+            "_id": landed, "student_id": "stu", "status": "pending", "version": 1,
+            "created_at": now, "seq": in_flight, "updated_at": now,
+        })
+        page = await changes(client, student, token)
+        assert [doc["_id"] for doc in page["changed"]] == [str(landed), later]
+
+        # Once both are older than the window the token moves past them
+        aged = {"$set": {"updated_at": now - timedelta(seconds=61)}}
+        await storage.submissions.collection.update_each([({"_id": doc["_id"]}, aged) for doc in await storage.submissions.list({})])
+        page = await changes(client, student, token)
+        assert len(page["changed"]) == 2
+        assert (await changes(client, student, page["next"]))["changed"] == []
+    api(scenario)
+
+def test_changes_pages_and_tombstones(api, submission_body, monkeypatch):
+    monkeypatch.setattr(main, "CHANGES_SETTLE_SECONDS", 0)
+
+    async def scenario(client):
+        student = await client.login("stu")
+        ids = [await create(client, student, submission_body) for _ in range(3)]
+        await client.delete(f"/submissions/{ids[1]}", headers=student)
+        # The create of ids[1] is superseded: only its tombstone is left
+        seen, token = [], None
+        while True:
+            page = await changes(client, student, token, limit=1)
+            seen += [("changed", doc["_id"]) for doc in page["changed"]]
+            seen += [("deleted", doc["_id"]) for doc in page["deleted"]]
+            token = page["next"]
+            if not page["more"]:
+                break
+        assert seen == [("changed", ids[0]), ("changed", ids[2]), ("deleted", ids[1])]
+        tombstone = (await changes(client, student))["deleted"][0]
+        assert tombstone["_id"] == ids[1] and {"seq", "deleted_at"} <= set(tombstone)
+        # Other students do not see the tombstone
+        other = await client.login("stu2")
+        assert (await changes(client, other))["deleted"] == []
+    api(scenario)
+
+def test_changes_token_expiry(api):
+    async def scenario(client):
+        student = await client.login("stu")
+        expired = encode_change_token(5, datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS, hours=1))
+        response = await client.get("/submissions/changes", params={"since": expired}, headers=student)
+        assert response.status_code == 410
+        recent = encode_change_token(5, datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS - 1))
+        assert (await client.get("/submissions/changes", params={"since": recent}, headers=student)).status_code == 200
+    api(scenario)
+
+def test_attachment_ranges(api, submission_body, mongo_store, bucket):
+    async def scenario(client):
+        student = await client.login("stu")
+        admin = await client.login("adm", "admin")
+        sid = await create(client, student, submission_body)
+        files = {"file": ("plan.txt", b"0123456789", "text/plain")}
+        response = await client.post(f"/submissions/{sid}/attachments", files=files, headers=student)
+        assert response.status_code == 200, response.text
+        file_id = response.json()["_id"]
+        url = f"/submissions/{sid}/attachments/{file_id}"
+
+        response = await client.get(url, headers=admin)
+        assert (response.status_code, response.content) == (200, b"0123456789")
+        tag = response.headers["ETag"]
+        response = await client.get(url, headers={**admin, "Range": "bytes=-3"})
+        assert (response.status_code, response.content, response.headers["Content-Range"]) == (206, b"789", "bytes 7-9/10")
+        response = await client.get(url, headers={**admin, "Range": "bytes=2-3", "If-Range": tag})
+        assert (response.status_code, response.content) == (206, b"23")
+        response = await client.get(url, headers={**admin, "Range": "bytes=2-3", "If-Range": '"changed"'})
+        assert (response.status_code, response.content) == (200, b"0123456789")
+        response = await client.get(url, headers={**admin, "Range": "bytes=10-"})
+        assert (response.status_code, response.headers["Content-Range"]) == (416, "bytes */10")
+        response = await client.get(url, headers={**admin, "Range": "bytes=5-2"})
+        assert response.status_code == 200
+        assert (await client.get(url, headers={**admin, "If-None-Match": tag})).status_code == 304
+        # Only the owner and admins
+        other = await client.login("stu2")
+        assert (await client.get(url, headers=other)).status_code == 404
+
+        response = await client.post(
+            f"/submissions/{sid}/attachments", content=b"not multipart",
+            headers={**student, "Content-Type": "multipart/form-data; boundary=XYZ"}
+        )
+        assert response.status_code == 400
+    api(scenario)
+
+@pytest.mark.parametrize("method, path", [("post", "/submissions/{sid}/attachments"), ("get", "/submissions/search?q=run")])
+def test_mongo_only_endpoints_on_memory(api, submission_body, method, path):
+    async def scenario(client):
+        student = await client.login("stu")
+        sid = await create(client, student, submission_body)
+        response = await getattr(client, method)(path.format(sid=sid), headers=student)
+        assert response.status_code == 501
+    api(scenario)
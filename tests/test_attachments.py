@@ -0,0 +1,112 @@
+# Attachment uploads and downloads: multipart parsing into the GridFS upload
+# stream, byte ranges and the conditional headers. GridFS is replaced by the
+# in-memory bucket of conftest.py.
+import asyncio
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from starlette.requests import Request
+from attachments import attachment_response, parse_range, receive_attachment
+
+BOUNDARY = b"XYZ"
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def upload_request(*chunks, content_type=b"multipart/form-data; boundary=" + BOUNDARY):
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    messages[-1]["more_body"] = False
+
+    async def receive():
+        return messages.pop(0)
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": [(b"content-type", content_type)]}, receive)
+
+def file_part(data: bytes, filename: bytes = b"plan.txt"):
+    return (
+        b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="file"; filename="' + filename
+        + b'"\r\nContent-Type: text/plain\r\n\r\n' + data
+    )
+
+END = b"\r\n--" + BOUNDARY + b"--\r\n"
+
+def test_upload_streams_the_file(bucket):
+    result = run(receive_attachment(upload_request(file_part(b"hello "), b"world" + END), {"submission_id": 1}))
+    assert result["filename"] == "plan.txt" and result["content_type"] == "text/plain" and result["length"] == 11
+    assert bytes(bucket.files[result["_id"]].data) == b"hello world"
+
+@pytest.mark.parametrize("chunks, detail", [
+    # Not multipart at all, as the declared boundary
+    ([b"this is not a multipart body"], "Malformed multipart upload"),
+    # File data already written, then a broken part header
+    ([file_part(b"abc"), b"\r\n--" + BOUNDARY + b"\r\nbad header\r\n\r\n"], "Malformed multipart upload"),
+    # Body ends inside the file
+    ([file_part(b"abc")], "Incomplete multipart upload"),
+    ([b"--" + BOUNDARY + b'\r\nContent-Disposition: form-data; name="note"\r\n\r\nx' + END], "No file in the upload"),
+])
+def test_bad_uploads_are_rejected(bucket, chunks, detail):
+    with pytest.raises(HTTPException) as error:
+        run(receive_attachment(upload_request(*chunks), {}))
+    assert (error.value.status_code, error.value.detail) == (400, detail)
+    assert not bucket.files
+    assert all(upload.aborted for upload in bucket.uploads)
+
+def test_upload_size_limit(bucket):
+    with pytest.raises(HTTPException) as error:
+        run(receive_attachment(upload_request(file_part(b"x" * 6), b"x" * 6 + END), {}, max_bytes=10))
+    assert error.value.status_code == 413
+    assert [upload.aborted for upload in bucket.uploads] == [True]
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-3", (0, 3)),
+    ("bytes=4-", (4, 9)),
+    ("bytes=5-100", (5, 9)),
+    # Suffix ranges: the last N bytes, all of them if N is larger
+    ("bytes=-3", (7, 9)),
+    ("bytes=-20", (0, 9)),
+    # Invalid or multi-range: ignored, the whole file is sent
+    (None, None),
+    ("bytes=3-1", None),
+    ("bytes=a-b", None),
+    ("bytes=-", None),
+    ("bytes=0-1,4-5", None),
+    ("items=0-1", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 10) == expected
+
+@pytest.mark.parametrize("header, length", [("bytes=10-", 10), ("bytes=-0", 10), ("bytes=-5", 0)])
+def test_parse_range_unsatisfiable(header, length):
+    with pytest.raises(HTTPException) as error:
+        parse_range(header, length)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == f"bytes */{length}"
+
+async def download(file_id, **headers):
+    response = await attachment_response(file_id, **headers)
+    body = b""
+    if response.status_code != 304:
+        async for chunk in response.body_iterator:
+            body += chunk
+    return response, body
+
+def test_download_ranges_and_validators(bucket):
+    stored = run(receive_attachment(upload_request(file_part(b"0123456789") + END), {}))
+    file_id = stored["_id"]
+    tag = f'"{file_id}"'
+
+    response, body = run(download(file_id))
+    assert (response.status_code, body, response.headers["ETag"]) == (200, b"0123456789", tag)
+    response, body = run(download(file_id, range_header="bytes=2-5"))
+    assert (response.status_code, body, response.headers["Content-Range"]) == (206, b"2345", "bytes 2-5/10")
+    assert response.headers["Content-Length"] == "4"
+    # If-Range: the range only applies to the same file
+    response, body = run(download(file_id, range_header="bytes=-2", if_range=tag))
+    assert (response.status_code, body) == (206, b"89")
+    response, body = run(download(file_id, range_header="bytes=-2", if_range=f'"{ObjectId()}"'))
+    assert (response.status_code, body) == (200, b"0123456789")
+    assert "Content-Range" not in response.headers
+    response, _ = run(download(file_id, if_none_match=f'"x", {tag}'))
+    assert response.status_code == 304
+    with pytest.raises(HTTPException) as error:
+        run(download(ObjectId()))
+    assert error.value.status_code == 404
@@ -0,0 +1,250 @@
+# Parity tests for the storage engines: the same repository and collection
+# calls against the memory engine, SQLite and MongoDB (through mongomock), so
+# the emulated query language keeps matching MongoDB's behaviour.
+#
+#   pip install -r tests/requirements.txt
+#   python -m pytest -q tests
+import asyncio
+import sqlite3
+from datetime import datetime, timedelta
+import pytest
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+import storage
+from models import after_cursor_filter, encode_cursor, version_filter
+
+ENGINES = ["memory", "sqlite", "mongomock"]
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+@pytest.fixture(params=ENGINES)
+def store(request, tmp_path, monkeypatch):
+    if request.param == "mongomock":
+        engine = request.getfixturevalue("mongo_store")
+    else:
+        engine = storage.create_store(request.param, str(tmp_path / "test.db"))
+    monkeypatch.setattr(storage, "_store", engine)
+    yield engine
+    if request.param != "mongomock":
+        engine.close()
+
+# Milliseconds, as BSON stores them
+def at(seconds: float):
+    return datetime(2030, 1, 1) + timedelta(milliseconds=int(seconds * 1000))
+
+def submission(created_at, **fields):
+    return {"_id": ObjectId(), "student_id": "s1", "status": "pending", "created_at": created_at, "version": 1, **fields}
+
+def test_find_filters_projection_and_sort(store):
+    async def scenario():
+        docs = [
+            submission(at(3), student_id="s1", status="approved", budget=30),
+            submission(at(1), student_id="s2", budget=10),
+            submission(at(2), student_id="s1", budget=20, note="x"),
+        ]
+        await storage.submissions.create_many(docs)
+        by_owner = await storage.submissions.list({"student_id": "s1"}, {"budget": 1}, [("created_at", 1), ("_id", 1)])
+        assert [d["budget"] for d in by_owner] == [20, 30]
+        assert set(by_owner[0]) == {"_id", "budget"}
+        newest = await storage.submissions.list({}, None, [("created_at", -1)], limit=2)
+        assert [d["budget"] for d in newest] == [30, 20]
+        skipped = await storage.submissions.list({}, None, [("created_at", 1)], limit=1, skip=1)
+        assert [d["budget"] for d in skipped] == [20]
+        in_status = await storage.submissions.list({"status": {"$in": ["approved", "revision"]}})
+        assert [d["budget"] for d in in_status] == [30]
+        not_s1 = await storage.submissions.list({"student_id": {"$ne": "s1"}})
+        assert [d["budget"] for d in not_s1] == [10]
+        ranged = await storage.submissions.list({"budget": {"$gte": 15, "$lt": 30}})
+        assert [d["budget"] for d in ranged] == [20]
+        either = await storage.submissions.list(
+            {"$or": [{"budget": 10}, {"status": "approved"}]}, None, [("created_at", 1)]
+        )
+        assert [d["budget"] for d in either] == [10, 30]
+        by_ids = await storage.submissions.by_ids([docs[0]["_id"], docs[1]["_id"]], {"budget": 1})
+        assert {oid: d["budget"] for oid, d in by_ids.items()} == {docs[0]["_id"]: 30, docs[1]["_id"]: 10}
+    run(scenario())
+
+def test_none_matches_missing_fields(store):
+    async def scenario():
+        await storage.submissions.create_many([
+            submission(at(1), budget=1, note="x"),
+            submission(at(2), budget=2, note=None),
+            submission(at(3), budget=3),
+        ])
+        missing = await storage.submissions.list({"note": None}, None, [("created_at", 1)])
+        assert [d["budget"] for d in missing] == [2, 3]
+        # Ranges never match a missing field
+        assert [d["budget"] for d in await storage.submissions.list({"note": {"$lt": "z"}})] == [1]
+        assert [d["budget"] for d in await storage.submissions.list({"note": {"$gte": ""}})] == [1]
+    run(scenario())
+
+def test_keyset_cursor_pages(store):
+    async def scenario():
+        # Equal timestamps and sub-millisecond ones: pages must not repeat or skip
+        created = [at(1), at(1), at(1), at(2) + timedelta(microseconds=400), at(2), at(3)]
+        docs = [submission(value, budget=i) for i, value in enumerate(created)]
+        await storage.submissions.create_many(docs)
+        sort = [("created_at", 1), ("_id", 1)]
+        seen, query = [], {}
+        while True:
+            page = await storage.submissions.list(query, None, sort, limit=2)
+            if not page:
+                break
+            seen += [d["_id"] for d in page]
+            last = page[-1]
+            query = after_cursor_filter(encode_cursor(last["created_at"], last["_id"]))
+        assert len(seen) == len(set(seen)) == len(docs)
+        assert seen == [d["_id"] for d in sorted(docs, key=lambda d: (storage.bson_value(d["created_at"]), d["_id"]))]
+    run(scenario())
+
+def test_update_returns_before_and_after(store):
+    async def scenario():
+        doc = submission(at(1), comment_count=0)
+        await storage.submissions.create(doc)
+        before = await storage.submissions.update(
+            {"_id": doc["_id"]},
+            {"$set": {"status": "approved"}, "$inc": {"version": 1, "comment_count": 2}, "$max": {"last": at(5)}},
+            {"status": 1, "version": 1}
+        )
+        assert before == {"_id": doc["_id"], "status": "pending", "version": 1}
+        after = await storage.submissions.collection.find_one_and_update(
+            {"_id": doc["_id"]}, {"$unset": {"last": ""}, "$min": {"comment_count": 1}}, return_after=True
+        )
+        assert after["status"] == "approved" and after["version"] == 2 and after["comment_count"] == 1
+        assert "last" not in after
+        assert await storage.submissions.update({"_id": ObjectId()}, {"$set": {"status": "x"}}) is None
+    run(scenario())
+
+def test_version_filters(store):
+    async def scenario():
+        versioned = submission(at(1), version=1)
+        legacy = submission(at(2))
+        del legacy["version"]
+        await storage.submissions.create_many([versioned, legacy])
+        bump = {"$inc": {"version": 1}}
+        assert await storage.submissions.update({"_id": versioned["_id"], **version_filter(1)}, bump)
+        # Stale version: no match
+        assert await storage.submissions.update({"_id": versioned["_id"], **version_filter(1)}, bump) is None
+        # Documents without a version count as version 0
+        assert await storage.submissions.update({"_id": legacy["_id"], **version_filter(0)}, bump)
+        assert (await storage.submissions.get({"_id": legacy["_id"]}))["version"] == 1
+    run(scenario())
+
+def test_duplicate_keys(store):
+    async def scenario():
+        await storage.users.create({"username": "ann", "role": "student", "version": 1})
+        with pytest.raises(DuplicateKeyError):
+            await storage.users.create({"username": "ann", "role": "admin", "version": 1})
+        doc = submission(at(1))
+        await storage.submissions.create(dict(doc))
+        with pytest.raises(DuplicateKeyError):
+            await storage.submissions.create(dict(doc))
+        errors = await storage.users.create_many([
+            {"username": "bob", "role": "student"},
+            {"username": "ann", "role": "student"},
+            {"username": "cat", "role": "student"},
+        ])
+        assert list(errors) == [1] and errors[1]["code"] == 11000
+        assert await storage.users.get("cat", {"role": 1}) is not None
+        # A unique field taken by an update
+        with pytest.raises(DuplicateKeyError):
+            await storage.users.collection.find_one_and_update({"username": "bob"}, {"$set": {"username": "ann"}})
+        assert (await storage.users.set_role("bob", "admin"))["version"] == 1
+    run(scenario())
+
+def test_counter_upserts(store):
+    async def scenario():
+        assert await storage.counters.increment("submissions") == 1
+        assert await storage.counters.increment("submissions", 5) == 6
+        assert await storage.counters.increment("other") == 1
+        results = await asyncio.gather(*[storage.counters.increment("race") for _ in range(10)])
+        assert sorted(results) == list(range(1, 11))
+    run(scenario())
+
+def test_leases(store):
+    async def scenario():
+        assert await storage.leases.acquire("job", "a", 60)
+        assert not await storage.leases.acquire("job", "b", 60)
+        # The holder can take it again before expiry
+        assert await storage.leases.acquire("job", "a", 60)
+        assert await storage.leases.renew("job", "a", 60)
+        assert not await storage.leases.renew("job", "b", 60)
+        await storage.leases.collection.find_one_and_update(
+            {"_id": "job"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        assert await storage.leases.acquire("job", "b", 60)
+        assert not await storage.leases.renew("job", "a", 60)
+    run(scenario())
+
+def test_update_each_and_delete_batch(store):
+    async def scenario():
+        docs = [submission(at(i), budget=i) for i in range(5)]
+        await storage.submissions.create_many(docs)
+        errors = await storage.submissions.update_each([
+            ({"_id": docs[0]["_id"]}, {"$set": {"status": "approved"}}),
+            ({"_id": ObjectId()}, {"$set": {"status": "approved"}}),
+        ])
+        assert errors == {}
+        assert [d["budget"] for d in await storage.submissions.list({"status": "approved"})] == [0]
+        collection = storage.submissions.collection
+        assert await collection.delete_batch({"budget": {"$gte": 1}}, [("created_at", 1), ("_id", 1)], 2) == 2
+        remaining = await storage.submissions.list({}, {"budget": 1}, [("created_at", 1)])
+        assert [d["budget"] for d in remaining] == [0, 3, 4]
+        assert await collection.delete_many({"budget": {"$in": [3, 4]}}) == 2
+        assert await collection.delete_batch({"budget": 99}, [("created_at", 1)], 10) == 0
+    run(scenario())
+
+def test_tombstone_and_event_purge(store):
+    async def scenario():
+        now = datetime.utcnow().replace(microsecond=0)
+        await storage.submission_tombstones.add({"_id": ObjectId(), "student_id": "s1", "seq": 1, "deleted_at": now - timedelta(days=40)})
+        await storage.submission_tombstones.add({"_id": ObjectId(), "student_id": "s1", "seq": 2, "deleted_at": now})
+        assert await storage.submission_tombstones.purge(now - timedelta(days=30), 10) == 1
+        assert [t["seq"] for t in await storage.submission_tombstones.list({})] == [2]
+        await storage.submission_events.add_many([
+            {"submission_id": ObjectId(), "type": "create", "timestamp": now - timedelta(days=400 - i)} for i in range(3)
+        ])
+        assert await storage.submission_events.purge(now - timedelta(days=398), 1) == 1
+        assert await storage.submission_events.purge(now - timedelta(days=398), 10) == 1
+        assert len(await storage.submission_events.list({})) == 1
+    run(scenario())
+
+# SQLite keeps lookup and sort fields in columns; a field added to them later
+# gets a column filled from the stored documents
+def test_sqlite_backfills_new_columns(tmp_path, monkeypatch):
+    path = str(tmp_path / "backfill.db")
+    monkeypatch.setitem(storage.SORT_FIELDS, "things", [])
+    first = storage.create_store("sqlite", path)
+    monkeypatch.setattr(storage, "_store", first)
+    run(first.collection("things").insert_each([{"_id": i, "rank": 3 - i} for i in range(3)]))
+    first.close()
+
+    monkeypatch.setitem(storage.SORT_FIELDS, "things", ["rank"])
+    second = storage.create_store("sqlite", path)
+    monkeypatch.setattr(storage, "_store", second)
+    found = run(second.collection("things").find({"rank": {"$gte": 2}}, sort=[("rank", 1)]))
+    assert [d["_id"] for d in found] == [1, 0]
+    second.close()
+    with sqlite3.connect(path) as connection:
+        assert sorted(connection.execute('SELECT _id, rank FROM "things"').fetchall()) == [("0", 3), ("1", 2), ("2", 1)]
+
+# Two stores on one file stand for two processes: their read-modify-writes
+# must not interleave
+def test_sqlite_updates_are_atomic_across_connections(tmp_path):
+    path = str(tmp_path / "shared.db")
+    stores = [storage.create_store("sqlite", path) for _ in range(2)]
+
+    async def increments(store, count):
+        counter = store.collection("counters")
+        return [
+            (await counter.find_one_and_update({"_id": "race"}, {"$inc": {"value": 1}}, {"value": 1}, return_after=True, upsert=True))["value"]
+            for _ in range(count)
+        ]
+
+    async def scenario():
+        return await asyncio.gather(*[increments(store, 200) for store in stores])
+    first, second = run(scenario())
+    for store in stores:
+        store.close()
+    assert sorted(first + second) == list(range(1, 401))